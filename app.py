@@ -1,10 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, render_template, request, redirect, url_for, jsonify, abort
+from flask import Response, stream_with_context, make_response, session
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, or_, event, insert, update, delete, select, tuple_, case
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import validates, aliased
 from dotenv import load_dotenv
 import os
-import pykakasi
-from flask import flash, get_flashed_messages
+import io
+import csv
+import json
+import math
+import sqlite3
+from itertools import zip_longest
+from collections import defaultdict
+from datetime import datetime, time, timezone
+from functools import wraps
+from time import perf_counter
+from flask import flash, get_flashed_messages, g, has_request_context, before_render_template, template_rendered
 from flask import redirect, url_for
+from reading import get_hiragana_reading, take_conversion_time, reading_cache_info
+from metrics import Histogram, CallbackMetric, SECONDS_BUCKETS, COUNT_BUCKETS, render_metrics
+from ingredient_index import IngredientIndex
+from units import UNITS, conversion_factor, UnitConversionError
+from simulation import CostMatrix
+from fragment_cache import make_fragment_cache
+from planner import MealPlanner, package_count
+from recipe_graph import RecipeCycleError, with_dependents, with_components, topological_order, creates_cycle, children_map
 
 
 load_dotenv()
@@ -15,10 +36,134 @@ app.secret_key = os.getenv("SECRET_KEY")  # なんでもOKだが一意に
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# コネクションプールの設定（.env で上書きできる。gunicorn.conf.py のワーカー数×スレッド数と合わせる）
+#   DB_POOL_SIZE          ワーカーごとに保持する接続数
+#   DB_MAX_OVERFLOW       混雑時に一時的に増やせる接続数
+#   DB_POOL_TIMEOUT       空き接続を待つ秒数
+#   DB_POOL_RECYCLE       この秒数より古い接続は作り直す（DB・ロードバランサのアイドル切断より短く）
+#   DB_POOL_PRE_PING      1 なら使う前に接続が生きているか確かめる
+#   DB_STATEMENT_TIMEOUT  1文の実行時間の上限（ミリ秒、PostgreSQL のみ）
+def engine_options_from_env(url):
+    if not url or url.startswith('sqlite'):
+        # SQLite はファイルを開くだけなのでプールの調整はしない
+        return {}
+    options = {
+        'pool_size': int(os.getenv("DB_POOL_SIZE", 5)),
+        'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", 5)),
+        'pool_timeout': float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        'pool_pre_ping': os.getenv("DB_POOL_PRE_PING", "1") == "1",
+    }
+    statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT")
+    if statement_timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f"-c statement_timeout={int(statement_timeout)}"}
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(app.config['SQLALCHEMY_DATABASE_URI'])
+
 
 
 db = SQLAlchemy(app)
-kks = pykakasi.kakasi()
+
+# SQLiteでも外部キー（ON DELETE CASCADE）を有効にする
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+# -------------------- 計測 --------------------
+# ルートごとに処理時間・クエリ数・DB時間・よみがな変換時間・テンプレート描画時間を記録し、よみがなキャッシュのヒット・ミス数と一緒に /metrics で出す。
+# SLOW_REQUEST_MS を設定すると、それより遅いリクエストを実行したSQLと一緒にログに出す。
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS") or 0)
+
+request_seconds = Histogram('app_request_seconds', "リクエストの処理時間（秒）", SECONDS_BUCKETS)
+db_seconds = Histogram('app_db_seconds', "リクエスト中のSQLの実行時間（秒）", SECONDS_BUCKETS)
+db_queries = Histogram('app_db_queries', "リクエスト中に実行したSQLの数", COUNT_BUCKETS)
+reading_seconds = Histogram('app_reading_seconds', "リクエスト中のよみがな変換の時間（秒）", SECONDS_BUCKETS)
+render_seconds = Histogram('app_render_seconds', "リクエスト中のテンプレート描画の時間（秒）", SECONDS_BUCKETS)
+reading_cache_hits = CallbackMetric('app_reading_cache_hits_total', "よみがな変換キャッシュのヒット数", 'counter',
+                                    lambda: {name: info['hits'] for name, info in reading_cache_info().items()})
+reading_cache_misses = CallbackMetric('app_reading_cache_misses_total', "よみがな変換キャッシュのミス数", 'counter',
+                                      lambda: {name: info['misses'] for name, info in reading_cache_info().items()})
+reading_cache_size = CallbackMetric('app_reading_cache_size', "よみがな変換キャッシュの件数", 'gauge',
+                                    lambda: {name: info['size'] for name, info in reading_cache_info().items()})
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'metrics' in g:
+        g.metrics['queries'] += 1
+        g.metrics['db'] += elapsed
+        if SLOW_REQUEST_MS:
+            g.metrics['statements'].append((elapsed, statement))
+
+@event.listens_for(Engine, 'handle_error')
+def drop_query_timer(context):
+    # 失敗したSQLは after_cursor_execute が呼ばれない
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    if 'metrics' in g:
+        g.metrics['render_start'] = perf_counter()
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    if 'metrics' in g and 'render_start' in g.metrics:
+        g.metrics['render'] += perf_counter() - g.metrics.pop('render_start')
+
+@app.before_request
+def start_request_metrics():
+    take_conversion_time()  # 前のリクエストの分を捨てる
+    g.metrics = {'start': perf_counter(), 'queries': 0, 'db': 0.0, 'render': 0.0, 'statements': []}
+
+@app.after_request
+def record_request_metrics(response):
+    metrics = g.pop('metrics', None)
+    if metrics is None:
+        return response
+    elapsed = perf_counter() - metrics['start']
+    route = request.endpoint or 'unknown'
+    request_seconds.observe(route, elapsed)
+    db_seconds.observe(route, metrics['db'])
+    db_queries.observe(route, metrics['queries'])
+    reading_seconds.observe(route, take_conversion_time())
+    render_seconds.observe(route, metrics['render'])
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        app.logger.warning(
+            "遅いリクエスト %s %s %.1fms（SQL %d件 %.1fms、描画 %.1fms）\n%s",
+            request.method, request.full_path, elapsed * 1000, metrics['queries'], metrics['db'] * 1000,
+            metrics['render'] * 1000,
+            '\n'.join(f"  {seconds * 1000:7.1f}ms {statement}" for seconds, statement in metrics['statements'])
+        )
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(
+        render_metrics([
+            request_seconds, db_seconds, db_queries, reading_seconds, render_seconds,
+            reading_cache_hits, reading_cache_misses, reading_cache_size
+        ]),
+        mimetype='text/plain; version=0.0.4'
+    )
+
+# テンプレートやコードを入れ替えたら ETag も変わるように、起動時に決める（どのワーカーでも同じ値）
+def deploy_tag():
+    paths = [os.path.abspath(__file__)]
+    for root, _, names in os.walk(os.path.join(app.root_path, app.template_folder)):
+        paths.extend(os.path.join(root, name) for name in names)
+    return format(int(max(os.path.getmtime(path) for path in paths)), 'x')
+
+DEPLOY_TAG = deploy_tag()
 
 # -------------------- メモ --------------------
 memo_text = (
@@ -37,51 +182,265 @@ class Ingredient(db.Model):
     price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     unit = db.Column(db.String(20), nullable=False)
+    reading = db.Column(db.String(200), index=True)  # 50音順ソート用のよみがな
+    density = db.Column(db.Float)  # g/ml（体積⇔重さの換算用、未登録なら固体の大さじ1 = 9g）
+
+    # 名前が設定されたとき（登録・名前変更）だけよみがなを計算する
+    @validates('name')
+    def set_reading(self, key, name):
+        self.reading = get_hiragana_reading(name)
+        return name
 
 class Recipe(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     servings = db.Column(db.Integer, nullable=False)
     memo = db.Column(db.Text)  
+    reading = db.Column(db.String(200), index=True)  # 50音順ソート用のよみがな
+    # コストのキャッシュ（食材・料理の更新時に refresh_recipe_costs で再計算）
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    per_serving_cost = db.Column(db.Float, nullable=False, default=0)
+    # 料理を削除すると材料の行はDB側で削除される
+    links = db.relationship('RecipeIngredient', cascade='all, delete-orphan', passive_deletes=True)
+
+    @validates('name')
+    def set_reading(self, key, name):
+        self.reading = get_hiragana_reading(name)
+        return name
 
 
 class RecipeIngredient(db.Model):
+    __table_args__ = (
+        # 料理ごとの材料検索にも使われる（recipe_id が先頭）
+        db.UniqueConstraint('recipe_id', 'ingredient_id', name='uq_recipe_ingredient'),
+        # 食材→料理の逆引き（削除ガード・コスト再計算）用
+        db.Index('ix_recipe_ingredient_ingredient_recipe', 'ingredient_id', 'recipe_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id'))
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id', ondelete='CASCADE'))
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id'))
     amount = db.Column(db.Float, nullable=False)
+    # 使用量の単位（空なら食材の単位）と、食材の単位への換算係数（保存時に計算）
+    unit = db.Column(db.String(20))
+    factor = db.Column(db.Float, nullable=False, default=1, server_default='1')
+
+# 料理を別の料理の材料として使う（だし・ソース・ご飯など）
+class RecipeComponent(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('recipe_id', 'component_id', name='uq_recipe_component'),
+        db.CheckConstraint('recipe_id <> component_id', name='ck_recipe_component_not_self'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipe.id', ondelete='CASCADE'), nullable=False)
+    component_id = db.Column(db.Integer, db.ForeignKey('recipe.id'), nullable=False, index=True)  # 子→親の逆引き用
+    amount = db.Column(db.Float, nullable=False)  # 何食分使うか
+
+# 食材の価格の履歴（追記のみ）。effective_from 以降はこの価格
+class IngredientPrice(db.Model):
+    __table_args__ = (
+        db.Index('ix_ingredient_price_ingredient_effective', 'ingredient_id', 'effective_from'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id', ondelete='CASCADE'), nullable=False)
+    effective_from = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    price = db.Column(db.Float, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+
+# 食材・料理を書き換えるたびに増える番号（1行だけ）。ETag やプロセス内キャッシュの鍵に使う
+class CatalogVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)  # UTC
+    # 一覧の断片キャッシュ用。食材の一覧・料理の一覧が変わったときだけ増える
+    ingredients_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    recipes_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# -------------------- コスト集計 --------------------
+def load_component_edges():
+    # 部品関係 (親, 子, 食分) は料理数程度の行なので全部読む
+    return db.session.query(RecipeComponent.recipe_id, RecipeComponent.component_id, RecipeComponent.amount).all()
+
+def refresh_recipe_costs(recipes):
+    # 指定した料理と、それを部品として使っている料理だけを子→親の順に再計算し、キャッシュ列に保存する
+    edges = load_component_edges()
+    recipe_ids = with_dependents([r.id for r in recipes], edges)
+    order = topological_order(recipe_ids, edges)
+    recipes_by_id = {r.id: r for r in Recipe.query.filter(Recipe.id.in_(recipe_ids))}
+
+    totals = dict(
+        db.session.query(
+            RecipeIngredient.recipe_id,
+            func.sum(Ingredient.price / Ingredient.quantity * RecipeIngredient.amount * RecipeIngredient.factor)
+        )
+        .join(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+        .group_by(RecipeIngredient.recipe_id)
+        .all()
+    )
 
-# -------------------- よみがな --------------------
-def get_hiragana_reading(text):
-    result = kks.convert(text)
-    return ''.join([item['hira'] for item in result])
+    # 部品の1食あたりコスト（再計算しない部品は保存済みの値を使う）
+    children = children_map(edges)
+    unchanged = {child for recipe_id in recipe_ids for child, _ in children[recipe_id]} - recipe_ids
+    unit_costs = dict(db.session.query(Recipe.id, Recipe.per_serving_cost).filter(Recipe.id.in_(unchanged)).all())
+
+    for recipe_id in order:
+        recipe = recipes_by_id[recipe_id]
+        total = totals.get(recipe_id) or 0
+        total += sum(unit_costs[child] * amount for child, amount in children[recipe_id])
+        recipe.total_cost = total
+        recipe.per_serving_cost = total / recipe.servings if recipe.servings > 0 else 0
+        unit_costs[recipe_id] = recipe.per_serving_cost
+
+def refresh_costs_for_ingredient(ingredient_id):
+    # この食材を使っている料理だけを再計算する
+    recipe_ids = db.session.query(RecipeIngredient.recipe_id).filter_by(ingredient_id=ingredient_id)
+    refresh_recipe_costs(Recipe.query.filter(Recipe.id.in_(recipe_ids)).all())
+
+def refresh_factors_for_ingredient(ingredient, old_unit=None):
+    # 食材の単位や密度が変わったら、単位つきの材料の換算係数を計算し直す。
+    # 単位を変えたときは old_unit を渡す。食材の単位のまま保存した材料（unit が空）は元の単位の量なので、先に元の単位を書き込む
+    if old_unit and old_unit != ingredient.unit:
+        RecipeIngredient.query.filter(
+            RecipeIngredient.ingredient_id == ingredient.id, RecipeIngredient.unit.is_(None)
+        ).update({RecipeIngredient.unit: old_unit}, synchronize_session='fetch')
+    links = RecipeIngredient.query.filter(
+        RecipeIngredient.ingredient_id == ingredient.id, RecipeIngredient.unit.isnot(None)
+    ).all()
+    for link in links:
+        link.factor = conversion_factor(link.unit, ingredient.unit, ingredient.density)
+
+# -------------------- 書き込み後の処理・条件付きGET --------------------
+def bump_catalog_version(ingredients=True, recipes=True):
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = db.session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1).values(
+            version=CatalogVersion.version + 1, updated_at=now,
+            ingredients_version=CatalogVersion.ingredients_version + int(ingredients),
+            recipes_version=CatalogVersion.recipes_version + int(recipes)
+        )
+    )
+    if result.rowcount == 0:
+        db.session.add(CatalogVersion(id=1, version=1, updated_at=now, ingredients_version=1, recipes_version=1))
+    db.session.commit()
+    g.pop('catalog_versions', None)
+
+def catalog_versions():
+    # 他のワーカーでの書き込みもすぐ反映されるよう、リクエストごとに1回DBから読む（主キーで1行）。
+    # 条件付きGET・断片キャッシュの鍵・コスト表のキャッシュは、同じリクエストの中ではこの値を共有する
+    if 'catalog_versions' not in g:
+        row = db.session.query(CatalogVersion).filter_by(id=1).first()
+        g.catalog_versions = {
+            'version': row.version if row else 0,
+            'updated_at': row.updated_at.replace(tzinfo=timezone.utc, microsecond=0) if row else None,
+            'ingredients': row.ingredients_version if row else 0,
+            'recipes': row.recipes_version if row else 0
+        }
+    return g.catalog_versions
+
+def current_catalog_version():
+    # (番号, 更新日時)
+    versions = catalog_versions()
+    return versions['version'], versions['updated_at']
+
+def catalog_changed(ingredients=False, recipes=False):
+    # 食材・料理を書き換えたルートから、コミットの後に呼ぶ。
+    # ingredients / recipes は食材の一覧・料理の一覧（名前・価格・コスト）が変わったかどうか
+    bump_catalog_version(ingredients, recipes)
+
+def conditional_on_catalog(view):
+    # 食材・料理が変わっていなければ、DBもテンプレートも使わずに 304 を返す
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('_flashes'):
+            # flash メッセージは1回しか出ないので、キャッシュさせない
+            return view(*args, **kwargs)
+        version, updated_at = current_catalog_version()
+        etag = f"{version}-{DEPLOY_TAG}"
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = bool(updated_at and request.if_modified_since and updated_at <= request.if_modified_since)
+        response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag)
+            if updated_at:
+                response.last_modified = updated_at
+            response.cache_control.no_cache = True  # 毎回問い合わせてもらう
+        return response
+    return wrapper
+
+fragment_cache = make_fragment_cache(os.getenv("FRAGMENT_CACHE_URL"))
 
 # -------------------- トップページ --------------------
 @app.route('/')
+@conditional_on_catalog
 def index():
-    ingredients = Ingredient.query.all()
-    recipes = Recipe.query.all()
-    recipe_costs = {}
-    for recipe in recipes:
-        links = RecipeIngredient.query.filter_by(recipe_id=recipe.id).all()
-        total = 0
-        for link in links:
-            ingredient = Ingredient.query.get(link.ingredient_id)
-            if ingredient:
-                unit_price = ingredient.price / ingredient.quantity
-                total += unit_price * link.amount
-        per_serving = total / recipe.servings if recipe.servings > 0 else 0
-        recipe_costs[recipe.id] = {'total': round(total), 'per_serving': round(per_serving)}
-
-    ingredients_sorted = sorted(ingredients, key=lambda x: get_hiragana_reading(x.name))
-    recipes_sorted = sorted(recipes, key=lambda x: get_hiragana_reading(x.name))
-    return render_template(
-        'index.html',
-        ingredients=ingredients_sorted,
-        recipes=recipes_sorted,
-        recipe_costs=recipe_costs,
-        memo=memo_text
-    )
+    # 食材・料理の一覧はページから /api/ingredients, /api/recipes を少しずつ読み込む
+    return render_template('index.html', memo=memo_text, units=list(UNITS))
+
+# -------------------- 一覧API --------------------
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+def paginate_by_reading(model):
+    # 50音順（reading, id）のキーセットページング。?q= は名前・よみがなの前方一致
+    query = model.query
+    q = request.args.get('q', '').strip()
+    if q:
+        query = query.filter(or_(
+            model.name.startswith(q, autoescape=True),
+            model.reading.startswith(get_hiragana_reading(q), autoescape=True)
+        ))
+    after_reading = request.args.get('after_reading')
+    after_id = request.args.get('after_id', type=int)
+    if after_reading is not None and after_id is not None:
+        query = query.filter(tuple_(model.reading, model.id) > tuple_(after_reading, after_id))
+
+    limit = max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+    rows = query.order_by(model.reading, model.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = {'after_reading': rows[-1].reading, 'after_id': rows[-1].id}
+    return rows, next_cursor
+
+def cached_fragment(kind, render):
+    # 一覧の1ページ分のJSONを、その一覧の版とクエリ文字列ごとにキャッシュする
+    key = f"{kind}:{catalog_versions()[kind]}:{request.query_string.decode('utf-8')}"
+    body = fragment_cache.get(key)
+    if body is None:
+        body = json.dumps(render(), ensure_ascii=False)
+        fragment_cache.set(key, body)
+    return Response(body, mimetype='application/json')
+
+@app.route('/api/ingredients')
+@conditional_on_catalog
+def api_ingredients():
+    def render():
+        ingredients, next_cursor = paginate_by_reading(Ingredient)
+        return {
+            'items': [
+                {'id': i.id, 'name': i.name, 'price': i.price, 'quantity': i.quantity, 'unit': i.unit}
+                for i in ingredients
+            ],
+            'next': next_cursor
+        }
+    return cached_fragment('ingredients', render)
+
+@app.route('/api/recipes')
+@conditional_on_catalog
+def api_recipes():
+    def render():
+        recipes, next_cursor = paginate_by_reading(Recipe)
+        return {
+            'items': [
+                {'id': r.id, 'name': r.name, 'servings': r.servings,
+                 'total': round(r.total_cost), 'per_serving': round(r.per_serving_cost)}
+                for r in recipes
+            ],
+            'next': next_cursor
+        }
+    return cached_fragment('recipes', render)
 
 # -------------------- 食材追加 --------------------
 @app.route('/add_ingredient', methods=['POST'])
@@ -90,13 +449,20 @@ def add_ingredient():
     price = float(request.form['price'])
     quantity = float(request.form['quantity'])
     unit = request.form['unit']
-    new_ingredient = Ingredient(name=name, price=price, quantity=quantity, unit=unit)
+    density = request.form.get('density', type=float)
+    fingerprint = ingredient_fingerprint()
+    new_ingredient = Ingredient(name=name, price=price, quantity=quantity, unit=unit, density=density)
     db.session.add(new_ingredient)
+    db.session.flush()
+    db.session.add(IngredientPrice(ingredient_id=new_ingredient.id, price=price, quantity=quantity))
     db.session.commit()
+    catalog_changed(ingredients=True)  # まだどの料理にも使われていない
+    sync_ingredient_index(fingerprint, lambda: ingredient_index.add(new_ingredient.id, name, unit))
     return redirect(url_for('index'))
 
 # -------------------- 食材編集 --------------------
 @app.route('/edit_ingredient/<int:id>')
+@conditional_on_catalog
 def edit_ingredient_form(id):
     ingredient = Ingredient.query.get_or_404(id)
     return render_template('edit_ingredient.html', ingredient=ingredient)
@@ -104,10 +470,33 @@ def edit_ingredient_form(id):
 @app.route('/update_ingredient/<int:id>', methods=['POST'])
 def update_ingredient(id):
     ingredient = Ingredient.query.get_or_404(id)
-    ingredient.price = float(request.form['price'])
-    ingredient.quantity = float(request.form['quantity'])
-    ingredient.unit = request.form['unit']
+    price = float(request.form['price'])
+    quantity = float(request.form['quantity'])
+    unit = request.form['unit']
+    density = request.form.get('density', type=float)
+    cost_changed = (ingredient.price, ingredient.quantity) != (price, quantity)
+    factor_changed = (ingredient.unit, ingredient.density) != (unit, density)
+    old_unit = ingredient.unit
+    ingredient.price = price
+    ingredient.quantity = quantity
+    ingredient.unit = unit
+    ingredient.density = density
+    if factor_changed:
+        try:
+            refresh_factors_for_ingredient(ingredient, old_unit)
+        except UnitConversionError as e:
+            db.session.rollback()
+            flash(f"料理で使われている単位を換算できないため更新できません。{e}")
+            return redirect(url_for('index'))
+    if cost_changed:
+        db.session.add(IngredientPrice(ingredient_id=ingredient.id, price=price, quantity=quantity))
+    recipes_changed = False
+    if cost_changed or factor_changed:
+        recipes_changed = RecipeIngredient.query.filter_by(ingredient_id=ingredient.id).first() is not None
+        refresh_costs_for_ingredient(ingredient.id)
     db.session.commit()
+    catalog_changed(ingredients=True, recipes=recipes_changed)
+    sync_ingredient_index(ingredient_fingerprint(), lambda: ingredient_index.add(ingredient.id, ingredient.name, ingredient.unit))
     return redirect(url_for('index'))
 
 @app.route('/delete_ingredient', methods=['POST'])
@@ -121,60 +510,174 @@ def delete_ingredient():
         return redirect(url_for('index'))
 
     if ingredient:
+        fingerprint = ingredient_fingerprint()
         db.session.delete(ingredient)
         db.session.commit()
+        catalog_changed(ingredients=True)  # 料理に使われている食材は削除できない
+        sync_ingredient_index(fingerprint, lambda: ingredient_index.remove(id))
     return redirect(url_for('index'))
 
 
+# -------------------- 食材検索（オートコンプリート） --------------------
+ingredient_index = IngredientIndex()
+SEARCH_LIMIT = 10
+
+def ingredient_fingerprint():
+    # 他のワーカーや import_data.py での追加・削除に気づくための (件数, 最大id)
+    return tuple(db.session.query(func.count(Ingredient.id), func.max(Ingredient.id)).one())
+
+def sync_ingredient_index(fingerprint_before, change):
+    # 索引が最新だったときだけ差分で反映する（古ければ次の検索で作り直す）
+    if ingredient_index.fingerprint == fingerprint_before:
+        change()
+        ingredient_index.fingerprint = ingredient_fingerprint()
+
+@app.route('/api/ingredients/search')
+def search_ingredients():
+    fingerprint = ingredient_fingerprint()
+    if ingredient_index.fingerprint != fingerprint:
+        ingredient_index.rebuild(db.session.query(Ingredient.id, Ingredient.name, Ingredient.unit).all())
+        ingredient_index.fingerprint = fingerprint
+    limit = min(request.args.get('limit', SEARCH_LIMIT, type=int), API_MAX_PAGE_SIZE)
+    return jsonify({'items': ingredient_index.search(request.args.get('q', ''), limit)})
+
+# -------------------- 料理の材料入力 --------------------
+def get_form_ingredients():
+    # {食材id: (使用量, 単位, 換算係数)} を返す。換算できない単位なら UnitConversionError
+    rows = []
+    for ing_id, amount, unit in zip_longest(
+        request.form.getlist('ing_id'), request.form.getlist('ing_amount'), request.form.getlist('ing_unit'), fillvalue=''
+    ):
+        if not ing_id:
+            continue
+        rows.append((int(ing_id), float(amount), unit or None))
+    ingredients = {i.id: i for i in Ingredient.query.filter(Ingredient.id.in_({row[0] for row in rows}))}
+
+    links = {}
+    for ing_id, amount, unit in rows:
+        ingredient = ingredients.get(ing_id)
+        if not ingredient:
+            continue
+        if unit == ingredient.unit:
+            unit = None
+        factor = conversion_factor(unit, ingredient.unit, ingredient.density)
+        if ing_id in links:
+            # 同じ食材が複数行あれば合算する（料理×食材は一意）。単位が違えば食材の単位にそろえる
+            prev_amount, prev_unit, prev_factor = links[ing_id]
+            if prev_unit == unit:
+                amount += prev_amount
+            else:
+                amount, unit, factor = prev_amount * prev_factor + amount * factor, None, 1.0
+        links[ing_id] = (amount, unit, factor)
+    return links
+
+def get_form_components(recipe_id=None):
+    # {部品の料理id: 食分}。循環する組み合わせなら RecipeCycleError
+    amounts = {}
+    for comp_id, amount in zip(request.form.getlist('comp_id'), request.form.getlist('comp_amount')):
+        if not comp_id:
+            continue
+        amounts[int(comp_id)] = amounts.get(int(comp_id), 0) + float(amount)
+    existing = {id for (id,) in db.session.query(Recipe.id).filter(Recipe.id.in_(amounts))}
+    amounts = {comp_id: amount for comp_id, amount in amounts.items() if comp_id in existing}
+    if recipe_id is not None and creates_cycle(recipe_id, amounts, load_component_edges()):
+        raise RecipeCycleError("この料理を部品に含む料理は、この料理の部品にできません。")
+    return amounts
+
+def sync_recipe_rows(model, key, recipe_id, submitted):
+    # submitted は {キー: {列: 値}}。既存の行との差分だけを一括で反映する
+    table = model.__table__
+    existing = {
+        row[key]: row
+        for row in db.session.execute(select(table).where(table.c.recipe_id == recipe_id)).mappings()
+    }
+    removed = [row['id'] for k, row in existing.items() if k not in submitted]
+    changed = [
+        {'id': existing[k]['id'], **values}
+        for k, values in submitted.items()
+        if k in existing and any(existing[k][column] != value for column, value in values.items())
+    ]
+    added = [
+        {'recipe_id': recipe_id, key: k, **values}
+        for k, values in submitted.items()
+        if k not in existing
+    ]
+    if removed:
+        db.session.execute(delete(model).where(model.id.in_(removed)))
+    if changed:
+        db.session.execute(update(model), changed)
+    if added:
+        db.session.execute(insert(model), added)
+
 # -------------------- 料理追加 --------------------
 @app.route('/add_recipe', methods=['POST'])
 def add_recipe():
     name = request.form['recipe_name']
     servings = int(request.form['servings'])
     memo = request.form.get('memo', '')  # ← メモ欄を取得
+    try:
+        form_ingredients = get_form_ingredients()
+        form_components = get_form_components()
+    except UnitConversionError as e:
+        flash(str(e))
+        return redirect(url_for('index'))
 
     recipe = Recipe(name=name, servings=servings, memo=memo)
     db.session.add(recipe)
     db.session.flush()
     
-    ing_ids = request.form.getlist('ing_id')
-    ing_amounts = request.form.getlist('ing_amount')
-    for ing_id, amount in zip(ing_ids, ing_amounts):
-        db.session.add(RecipeIngredient(recipe_id=recipe.id, ingredient_id=int(ing_id), amount=float(amount)))
+    for ing_id, (amount, unit, factor) in form_ingredients.items():
+        db.session.add(RecipeIngredient(recipe_id=recipe.id, ingredient_id=ing_id, amount=amount, unit=unit, factor=factor))
+    for comp_id, amount in form_components.items():
+        db.session.add(RecipeComponent(recipe_id=recipe.id, component_id=comp_id, amount=amount))
 
+    refresh_recipe_costs([recipe])
     db.session.commit()
+    catalog_changed(recipes=True)
     return redirect(url_for('index'))
 
 
 
 # -------------------- 料理編集 --------------------
 @app.route('/edit_recipe/<int:id>')
+@conditional_on_catalog
 def edit_recipe(id):
     recipe = Recipe.query.get_or_404(id)
-    ingredients = Ingredient.query.all()
     links = RecipeIngredient.query.filter_by(recipe_id=recipe.id).all()
-    return render_template('edit_recipe.html', name=recipe.name, data=recipe, ingredients=ingredients, ingredients_dict={i.id: i for i in ingredients}, links=links)
+    # 食材の選択は /api/ingredients/search で行うので、使っている食材だけ読む
+    ingredients = Ingredient.query.filter(Ingredient.id.in_([link.ingredient_id for link in links])).all()
+    components = (
+        db.session.query(RecipeComponent, Recipe)
+        .join(Recipe, Recipe.id == RecipeComponent.component_id)
+        .filter(RecipeComponent.recipe_id == recipe.id)
+        .all()
+    )
+    return render_template('edit_recipe.html', name=recipe.name, data=recipe, ingredients_dict={i.id: i for i in ingredients}, links=links, components=components, units=list(UNITS))
 
 @app.route('/update_recipe/<int:id>', methods=['POST'])
 def update_recipe(id):
     recipe = Recipe.query.get_or_404(id)
-    recipe.servings = request.form.get('servings')
+    try:
+        submitted = get_form_ingredients()
+        components = get_form_components(recipe.id)
+    except (UnitConversionError, RecipeCycleError) as e:
+        flash(str(e))
+        return redirect(url_for('edit_recipe', id=id))
+    recipe.servings = int(request.form.get('servings'))
     recipe.memo = request.form.get('memo')
 
-    # 食材の更新処理
-    RecipeIngredient.query.filter_by(recipe_id=recipe.id).delete()
-    ingredient_ids = request.form.getlist('ing_id')
-    amounts = request.form.getlist('ing_amount')
-
-    for ing_id, amount in zip(ingredient_ids, amounts):
-        link = RecipeIngredient(
-            recipe_id=recipe.id,
-            ingredient_id=int(ing_id),
-            amount=float(amount)
-        )
-        db.session.add(link)
+    # 食材・部品の更新処理（既存の行との差分だけを反映する）
+    sync_recipe_rows(RecipeIngredient, 'ingredient_id', recipe.id, {
+        ing_id: {'amount': amount, 'unit': unit, 'factor': factor}
+        for ing_id, (amount, unit, factor) in submitted.items()
+    })
+    sync_recipe_rows(RecipeComponent, 'component_id', recipe.id, {
+        comp_id: {'amount': amount} for comp_id, amount in components.items()
+    })
 
+    refresh_recipe_costs([recipe])
     db.session.commit()
+    catalog_changed(recipes=True)
     #flash("更新しました")
     return redirect('/')
 
@@ -186,37 +689,474 @@ def update_recipe(id):
 def delete_recipe():
     name = request.form['name']
     recipe = Recipe.query.filter_by(name=name).first()
+
+    # 他の料理の部品になっていれば削除をブロック
+    if recipe and RecipeComponent.query.filter_by(component_id=recipe.id).first():
+        flash("この料理は他の料理に使用されています。削除できません。")
+        return redirect(url_for('edit_recipe', id=recipe.id))
+
     if recipe:
-        RecipeIngredient.query.filter_by(recipe_id=recipe.id).delete()
-        db.session.delete(recipe)
+        db.session.delete(recipe)  # 材料・部品の行は ON DELETE CASCADE で消える
         db.session.commit()
+        catalog_changed(recipes=True)
     return redirect(url_for('index'))
 
 # -------------------- コスト計算API --------------------
+def calculate_recipe_cost_details(recipes):
+    # 指定した料理の材料と食材を1回のクエリでまとめて取得する
+    rows = (
+        db.session.query(RecipeIngredient, Ingredient)
+        .outerjoin(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .filter(RecipeIngredient.recipe_id.in_([r.id for r in recipes]))
+        .order_by(RecipeIngredient.id)
+        .all()
+    )
+    totals = {recipe.id: 0 for recipe in recipes}
+    details = {recipe.id: [] for recipe in recipes}
+    for item, ing in rows:
+        if not ing:
+            details[item.recipe_id].append(f"{item.ingredient_id}: 未登録")
+            continue
+        unit_price = ing.price / ing.quantity
+        cost = unit_price * item.amount * item.factor
+        totals[item.recipe_id] += cost
+        if item.unit:
+            amount_text = f"{item.amount}{item.unit}（{item.amount * item.factor:g}{ing.unit}）"
+        else:
+            amount_text = f"{item.amount}{ing.unit}"
+        details[item.recipe_id].append(f"{ing.name}: {amount_text} × {unit_price:.2f}円 = {cost:.2f}円")
+
+    # 部品の料理は保存済みの1食あたりコストを使う
+    components = (
+        db.session.query(RecipeComponent, Recipe)
+        .join(Recipe, Recipe.id == RecipeComponent.component_id)
+        .filter(RecipeComponent.recipe_id.in_([r.id for r in recipes]))
+        .order_by(RecipeComponent.id)
+        .all()
+    )
+    for item, component in components:
+        cost = component.per_serving_cost * item.amount
+        totals[item.recipe_id] += cost
+        details[item.recipe_id].append(
+            f"{component.name}: {item.amount}食分 × {component.per_serving_cost:.2f}円 = {cost:.2f}円"
+        )
+
+    results = {}
+    for recipe in recipes:
+        total_cost = totals[recipe.id]
+        per_serving = total_cost / recipe.servings if recipe.servings > 0 else 0
+        results[recipe.id] = {
+            'total': round(total_cost),
+            'per_serving': round(per_serving),
+            'details': details[recipe.id]
+        }
+    return results
+
 @app.route('/get_recipe_cost/<recipe_name>')
+@conditional_on_catalog
 def get_recipe_cost(recipe_name):
     recipe = Recipe.query.filter_by(name=recipe_name).first()
     if not recipe:
         return jsonify({'error': 'not found'})
-    items = RecipeIngredient.query.filter_by(recipe_id=recipe.id).all()
-    servings = recipe.servings
-    total_cost = 0
-    details = []
-    for item in items:
-        ing = Ingredient.query.get(item.ingredient_id)
-        if not ing:
-            details.append(f"{item.ingredient_id}: 未登録")
-            continue
-        unit_price = ing.price / ing.quantity
-        cost = unit_price * item.amount
-        total_cost += cost
-        details.append(f"{ing.name}: {item.amount}{ing.unit} × {unit_price:.2f}円 = {cost:.2f}円")
-    per_serving = total_cost / servings if servings > 0 else 0
+    return jsonify(calculate_recipe_cost_details([recipe])[recipe.id])
+
+# 複数の料理のコストを1回のリクエストで返す
+# 例: POST {"ids": [1, 2], "names": ["エビチャーハン"]}
+@app.route('/get_recipe_costs', methods=['POST'])
+def get_recipe_costs():
+    data = request.get_json(silent=True) or {}
+    try:
+        if not isinstance(data.get('ids', []), list) or not isinstance(data.get('names', []), list):
+            raise TypeError
+        ids = [int(i) for i in data.get('ids', [])]
+        names = [str(n) for n in data.get('names', [])]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'ids は料理idのリスト、names は料理名のリストで指定してください'}), 400
+    recipes = Recipe.query.filter(or_(Recipe.id.in_(ids), Recipe.name.in_(names))).all()
+    costs = calculate_recipe_cost_details(recipes)
+
+    found_ids = {recipe.id for recipe in recipes}
+    found_names = {recipe.name for recipe in recipes}
+    not_found = [i for i in ids if i not in found_ids] + [n for n in names if n not in found_names]
+    return jsonify({
+        'recipes': [dict(id=recipe.id, name=recipe.name, **costs[recipe.id]) for recipe in recipes],
+        'not_found': not_found
+    })
+
+# -------------------- 過去の時点のコスト --------------------
+def parse_as_of(text):
+    # 日付だけならその日の終わりの時点とする
+    at = datetime.fromisoformat(text)
+    return datetime.combine(at.date(), time.max) if len(text) == 10 else at
+
+def calculate_costs_as_of(at, recipe_ids=None):
+    # 各食材の at 時点の価格を1回の範囲結合で求め、料理ごとに集計する（部品は子→親の順に評価）
+    edges = load_component_edges()
+    if recipe_ids is None:
+        recipe_ids = {id for (id,) in db.session.query(Recipe.id)}
+    else:
+        # 存在しない料理のidは外す
+        known = {id for (id,) in db.session.query(Recipe.id).filter(Recipe.id.in_(recipe_ids))}
+        recipe_ids = with_components(known, edges)
+    order = topological_order(recipe_ids, edges)
+
+    latest = (
+        select(IngredientPrice.ingredient_id, func.max(IngredientPrice.effective_from).label('effective_from'))
+        .where(IngredientPrice.effective_from <= at)
+        .group_by(IngredientPrice.ingredient_id)
+        .subquery()
+    )
+    totals = dict(
+        db.session.query(
+            RecipeIngredient.recipe_id,
+            func.sum(IngredientPrice.price / IngredientPrice.quantity * RecipeIngredient.amount * RecipeIngredient.factor)
+        )
+        .join(latest, latest.c.ingredient_id == RecipeIngredient.ingredient_id)
+        .join(IngredientPrice, (IngredientPrice.ingredient_id == latest.c.ingredient_id)
+              & (IngredientPrice.effective_from == latest.c.effective_from))
+        .filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+        .group_by(RecipeIngredient.recipe_id)
+        .all()
+    )
+    # at 以前の価格がない食材は合計に入らないので、料理ごとにidを返して 0円 と区別できるようにする
+    missing = defaultdict(set)
+    for recipe_id, ingredient_id in (
+        db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id)
+        .outerjoin(latest, latest.c.ingredient_id == RecipeIngredient.ingredient_id)
+        .filter(RecipeIngredient.recipe_id.in_(recipe_ids), latest.c.ingredient_id.is_(None))
+    ):
+        missing[recipe_id].add(ingredient_id)
+
+    recipes = {id: (name, servings) for id, name, servings in
+               db.session.query(Recipe.id, Recipe.name, Recipe.servings).filter(Recipe.id.in_(recipe_ids))}
+    children = children_map(edges)
+    per_serving_costs = {}
+    results = {}
+    for recipe_id in order:
+        name, servings = recipes[recipe_id]
+        total = totals.get(recipe_id) or 0
+        total += sum(per_serving_costs[child] * amount for child, amount in children[recipe_id])
+        for child, _ in children[recipe_id]:
+            missing[recipe_id] |= missing[child]
+        per_serving_costs[recipe_id] = total / servings if servings > 0 else 0
+        results[recipe_id] = {
+            'id': recipe_id, 'name': name,
+            'total': round(total), 'per_serving': round(per_serving_costs[recipe_id]),
+            'missing_ingredient_ids': sorted(missing[recipe_id])
+        }
+    return results
+
+# 例: /api/costs?at=2026-03-31（全料理）、/api/costs?at=2026-03-31&id=1&id=2
+#   missing_ingredient_ids はその時点の価格がなく合計に入っていない食材（部品の料理の分も含む）
+#   id を指定したときは、見つからなかった id を not_found に返す
+@app.route('/api/costs')
+def costs_as_of():
+    try:
+        at = parse_as_of(request.args['at'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'at には日付（例: 2026-03-31）を指定してください'}), 400
+    ids = list(dict.fromkeys(request.args.getlist('id', type=int)))
+    results = calculate_costs_as_of(at, ids or None)
+    if not ids:
+        return jsonify({'at': at.isoformat(), 'recipes': list(results.values())})
     return jsonify({
-        'total': round(total_cost),
-        'per_serving': round(per_serving),
-        'details': details
+        'at': at.isoformat(),
+        'recipes': [results[id] for id in ids if id in results],
+        'not_found': [id for id in ids if id not in results]
     })
 
+@app.route('/api/ingredients/<int:id>/prices')
+def ingredient_prices(id):
+    prices = (
+        IngredientPrice.query.filter_by(ingredient_id=id)
+        .order_by(IngredientPrice.effective_from)
+        .all()
+    )
+    return jsonify({'items': [
+        {'effective_from': p.effective_from.isoformat(), 'price': p.price, 'quantity': p.quantity}
+        for p in prices
+    ]})
+
+# -------------------- 価格の試算 --------------------
+MAX_SCENARIOS = 5000
+cost_matrix_cache = {}
+
+def build_cost_matrix():
+    # 料理×食材の使用量を読み、部品の料理は子→親の順に展開しておく
+    recipes = db.session.query(Recipe.id, Recipe.name, Recipe.servings).order_by(Recipe.id).all()
+    servings = {id: s for id, _, s in recipes}
+    rows = defaultdict(dict)
+    for recipe_id, ingredient_id, amount in db.session.query(
+        RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id, RecipeIngredient.amount * RecipeIngredient.factor
+    ):
+        rows[recipe_id][ingredient_id] = rows[recipe_id].get(ingredient_id, 0) + amount
+
+    edges = load_component_edges()
+    children = children_map(edges)
+    for recipe_id in topological_order(servings, edges):
+        for child, used in children[recipe_id]:
+            if servings[child] <= 0:
+                continue
+            for ingredient_id, amount in rows[child].items():
+                rows[recipe_id][ingredient_id] = rows[recipe_id].get(ingredient_id, 0) + amount * used / servings[child]
+    return CostMatrix(recipes, rows)
+
+def get_cost_matrix():
+    # 食材・料理の番号が変わったら作り直す（他のワーカーや import_data.py の書き込みも反映される）
+    version, _ = current_catalog_version()
+    if cost_matrix_cache.get('version') != version:
+        cost_matrix_cache.update(matrix=build_cost_matrix(), version=version)
+    return cost_matrix_cache['matrix']
+
+def parse_scenario(scenario):
+    # {"ratios": {"食材id": 倍率}, "prices": {"食材id": 価格}} -> (倍率, 価格)。キーは int、値は有限の float にする
+    ratios, prices = scenario.get('ratios', {}), scenario.get('prices', {})
+    if not isinstance(ratios, dict) or not isinstance(prices, dict):
+        raise TypeError('ratios / prices はオブジェクトで指定してください')
+    parsed = tuple({int(id): float(value) for id, value in values.items()} for values in (ratios, prices))
+    if not all(math.isfinite(value) for values in parsed for value in values.values()):
+        raise ValueError('倍率・価格は数値で指定してください')
+    return parsed
+
+# 例: POST {"scenarios": [{"ratios": {"1": 1.1}}, {"prices": {"2": 5000}}]}
+#   ratios は価格の倍率、prices は購入量あたりの価格（購入量は現在の値）
+@app.route('/api/simulate', methods=['POST'])
+def simulate():
+    data = request.get_json(silent=True) or {}
+    scenarios = data.get('scenarios', []) if isinstance(data, dict) else None
+    if not isinstance(scenarios, list):
+        return jsonify({'error': 'scenarios はリストで指定してください'}), 400
+    if len(scenarios) > MAX_SCENARIOS:
+        return jsonify({'error': f'シナリオは{MAX_SCENARIOS}件までです'}), 400
+    try:
+        scenarios = [parse_scenario(scenario) for scenario in scenarios]
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({
+            'error': 'scenarios は [{"ratios": {食材id: 倍率}, "prices": {食材id: 価格}}] の形で指定してください'
+        }), 400
+
+    matrix = get_cost_matrix()
+    ingredients = {id: (price, quantity) for id, price, quantity in
+                   db.session.query(Ingredient.id, Ingredient.price, Ingredient.quantity)}
+    unit_prices = {id: price / quantity for id, (price, quantity) in ingredients.items()}
+
+    overrides = []
+    for ratios, prices in scenarios:
+        unit_overrides = {}
+        for id, ratio in ratios.items():
+            if id in unit_prices:
+                unit_overrides[id] = unit_prices[id] * ratio
+        for id, price in prices.items():
+            if id in ingredients:
+                unit_overrides[id] = price / ingredients[id][1]
+        overrides.append(unit_overrides)
+
+    base, results = matrix.simulate(unit_prices, overrides)
+    return jsonify({
+        'recipes': [{'id': id, 'name': name} for id, name, _ in matrix.recipes],
+        'baseline': {
+            'total': [round(t) for t in base],
+            'per_serving': [round(c) for c in matrix.per_serving(base)]
+        },
+        'scenarios': [
+            {'total': [round(t) for t in totals], 'per_serving': [round(c) for c in matrix.per_serving(totals)]}
+            for totals in results
+        ]
+    })
+
+# -------------------- 買い物リスト --------------------
+def build_shopping_list(servings_by_recipe):
+    # servings_by_recipe: {料理id: 作る食数}。部品の料理は親→子の順に必要な食数を足していく
+    edges = load_component_edges()
+    recipe_ids = with_components(servings_by_recipe, edges)
+    recipes = dict(db.session.query(Recipe.id, Recipe.servings).filter(Recipe.id.in_(recipe_ids)))
+    recipe_ids = {id for id in recipe_ids if id in recipes}  # 存在しない料理のidは外す
+    needed = {id: servings_by_recipe.get(id, 0) for id in recipe_ids}
+    children = children_map(edges)
+    for recipe_id in reversed(topological_order(recipe_ids, edges)):
+        if recipes[recipe_id] <= 0:
+            continue
+        for child, used in children[recipe_id]:
+            needed[child] += needed[recipe_id] / recipes[recipe_id] * used
+
+    # 料理ごとの倍率（作る食数 / 材料の食数）をかけて、食材ごとに1回のクエリで合計する
+    scales = {id: count / recipes[id] for id, count in needed.items() if count > 0 and recipes[id] > 0}
+    if not scales:
+        return {'items': [], 'spend': 0, 'consumed': 0}
+    scale = case(scales, value=RecipeIngredient.recipe_id, else_=0)
+    rows = (
+        db.session.query(
+            Ingredient.id, Ingredient.name, Ingredient.unit, Ingredient.price, Ingredient.quantity,
+            func.sum(RecipeIngredient.amount * RecipeIngredient.factor * scale)
+        )
+        .join(RecipeIngredient, RecipeIngredient.ingredient_id == Ingredient.id)
+        .filter(RecipeIngredient.recipe_id.in_(scales))
+        .group_by(Ingredient.id, Ingredient.name, Ingredient.unit, Ingredient.price, Ingredient.quantity)
+        .order_by(Ingredient.reading, Ingredient.id)
+    )
+
+    items = []
+    for id, name, unit, price, quantity, used in rows:
+        if quantity <= 0:
+            continue
+        packages = package_count(used, quantity)
+        items.append({
+            'id': id, 'name': name, 'unit': unit,
+            'used': round(used, 2),
+            'packages': packages,
+            'leftover': round(packages * quantity - used, 2),
+            'spend': round(packages * price),
+            'consumed': round(used * price / quantity)
+        })
+    return {
+        'items': items,
+        'spend': sum(item['spend'] for item in items),
+        'consumed': sum(item['consumed'] for item in items)
+    }
+
+# 例: POST {"recipes": [{"id": 1, "servings": 4}, {"id": 3, "servings": 2}]}
+@app.route('/api/shopping_list', methods=['POST'])
+def shopping_list():
+    data = request.get_json(silent=True) or {}
+    servings_by_recipe = {}
+    try:
+        if not isinstance(data, dict):
+            raise TypeError
+        for item in data.get('recipes', []):
+            servings_by_recipe[int(item['id'])] = servings_by_recipe.get(int(item['id']), 0) + float(item['servings'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'recipes は [{"id": 料理id, "servings": 食数}] の形で指定してください'}), 400
+    return jsonify(build_shopping_list(servings_by_recipe))
+
+# -------------------- 献立の自動作成 --------------------
+MAX_PLAN_MEALS = 63  # 1日3食×3週間。貪欲法は 回数×料理数 に比例するので、1リクエストの時間をこれで抑える
+
+def plan_meals(meals, people=1, max_repeat=2, budget=None, mode='cost', recipe_ids=None):
+    matrix = get_cost_matrix()
+    recipes = matrix.recipes
+    if recipe_ids:
+        recipes = [recipe for recipe in recipes if recipe[0] in recipe_ids]
+    ingredients = {id: (price, quantity) for id, price, quantity in
+                   db.session.query(Ingredient.id, Ingredient.price, Ingredient.quantity)}
+    rows = {id: dict(row) for (id, _, _), row in zip(matrix.recipes, matrix.rows)}
+    plan = MealPlanner(recipes, rows, ingredients).plan(
+        meals, people=people, max_repeat=max_repeat, budget=budget, mode=mode
+    )
+
+    shopping = build_shopping_list({id: count * people for id, _, count in plan['recipes']})
+    return {
+        'recipes': [{'id': id, 'name': name, 'count': count} for id, name, count in plan['recipes']],
+        'shopping': shopping['items'],
+        'spend': shopping['spend'],
+        'consumed': shopping['consumed'],
+        'within_budget': plan['within_budget']
+    }
+
+# 例: POST {"meals": 7, "people": 2, "budget": 5000, "mode": "variety"}
+@app.route('/api/plan', methods=['POST'])
+def api_plan():
+    data = request.get_json(silent=True) or {}
+    try:
+        if not isinstance(data, dict):
+            raise TypeError('リクエストはJSONオブジェクトで指定してください。')
+        meals = int(data.get('meals', 7))
+        people = int(data.get('people', 1))
+        max_repeat = int(data.get('max_repeat', 2))
+        if meals > MAX_PLAN_MEALS or max_repeat > MAX_PLAN_MEALS:
+            raise ValueError(f'回数・繰り返し回数は{MAX_PLAN_MEALS}までです。')
+        budget = float(data['budget']) if data.get('budget') is not None else None
+        recipe_ids = {int(id) for id in data.get('recipe_ids', [])}
+        return jsonify(plan_meals(meals, people, max_repeat, budget, data.get('mode', 'cost'), recipe_ids))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+# -------------------- エクスポート --------------------
+EXPORT_BATCH_SIZE = 1000  # サーバー側カーソルから1回に受け取る行数
+
+EXPORT_FIELDS = {
+    'ingredients': ['id', 'name', 'price', 'quantity', 'unit', 'unit_price'],
+    'recipes': ['id', 'name', 'servings', 'total_cost', 'per_serving_cost'],
+}
+
+def iter_ingredient_rows():
+    stmt = (
+        select(Ingredient.id, Ingredient.name, Ingredient.price, Ingredient.quantity, Ingredient.unit)
+        .order_by(Ingredient.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for id, name, price, quantity, unit in db.session.execute(stmt):
+        yield {
+            'id': id, 'name': name, 'price': price, 'quantity': quantity, 'unit': unit,
+            'unit_price': round(price / quantity, 4)
+        }
+
+def iter_recipe_rows():
+    # 料理順に材料のコストを流しながら合計する（全件をメモリに載せない）
+    component = aliased(Recipe)
+    component_cost = (
+        select(func.coalesce(func.sum(component.per_serving_cost * RecipeComponent.amount), 0))
+        .select_from(RecipeComponent)
+        .join(component, component.id == RecipeComponent.component_id)
+        .where(RecipeComponent.recipe_id == Recipe.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            Recipe.id, Recipe.name, Recipe.servings, component_cost,
+            Ingredient.price / Ingredient.quantity * RecipeIngredient.amount * RecipeIngredient.factor
+        )
+        .outerjoin(RecipeIngredient, RecipeIngredient.recipe_id == Recipe.id)
+        .outerjoin(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+        .order_by(Recipe.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    current = None
+    total = 0.0
+    for id, name, servings, components_total, cost in db.session.execute(stmt):
+        if not current or current[0] != id:
+            if current:
+                yield make_recipe_row(*current, total)
+            current = (id, name, servings)
+            total = float(components_total)
+        total += cost or 0
+    if current:
+        yield make_recipe_row(*current, total)
+
+def make_recipe_row(id, name, servings, total):
+    per_serving = total / servings if servings > 0 else 0
+    return {
+        'id': id, 'name': name, 'servings': servings,
+        'total_cost': round(total, 2), 'per_serving_cost': round(per_serving, 2)
+    }
+
+def iter_export_lines(kind, fmt):
+    rows = iter_ingredient_rows() if kind == 'ingredients' else iter_recipe_rows()
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS[kind])
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+# 例: /export/recipes.csv, /export/ingredients.jsonl
+@app.route('/export/<kind>.<fmt>')
+def export(kind, fmt):
+    if kind not in EXPORT_FIELDS or fmt not in ('csv', 'jsonl'):
+        abort(404)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(iter_export_lines(kind, fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'}
+    )
+
 if __name__ == '__main__':
     app.run(debug=True)
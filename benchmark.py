@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+# ルートの性能を測るコマンド（合成したカタログを作ってから Flask のテストクライアントで叩く）
+#   python benchmark.py                                   一時ファイルの SQLite、食材1000・材料10000行
+#   python benchmark.py --ingredients 10000 --links 50000
+#   python benchmark.py --db postgresql://localhost/bench_db   ※テーブルを作り直すので空の専用DBを使うこと
+#                                                         （テーブルがあれば止まる。消してよければ --force）
+#   python benchmark.py --save-baseline                   結果を benchmark_baselines/<名前>.json に保存
+#   python benchmark.py --compare                         保存した結果と比べ、遅くなっていれば終了コード1
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines')
+REGRESSION_RATIO = 1.5  # p50 がこの倍率を超えたら遅くなったとみなす
+
+# 合成データの名前 ----------------------------------------------------------------------
+INGREDIENT_WORDS = [
+    'にんじん', '玉ねぎ', 'じゃがいも', 'キャベツ', '白菜', '大根', 'ほうれん草', '小松菜', 'ねぎ', 'ピーマン',
+    'なす', 'トマト', 'きゅうり', 'もやし', 'しめじ', 'えのき', 'しいたけ', 'ごぼう', 'れんこん', 'かぼちゃ',
+    '豚バラ肉', '豚こま肉', '鶏もも肉', '鶏むね肉', '牛こま肉', '合いびき肉', 'ベーコン', 'ウインナー', 'ハム',
+    '鮭', 'さば', 'えび', 'いか', 'ツナ缶', '豆腐', '油揚げ', '納豆', '卵', '牛乳', 'バター', 'チーズ',
+    '白ご飯', '食パン', 'うどん', 'そば', 'パスタ', '小麦粉', '片栗粉', 'パン粉',
+    'しょうゆ', 'みそ', '砂糖', '塩', '酢', 'みりん', '料理酒', 'サラダ油', 'ごま油', 'マヨネーズ', 'ケチャップ',
+]
+INGREDIENT_PREFIXES = ['', '国産', '有機', '冷凍', '特売', '業務用', '北海道産', '九州産']
+RECIPE_WORDS = [
+    '肉じゃが', '親子丼', 'カレー', '生姜焼き', '野菜炒め', '麻婆豆腐', 'みそ汁', '豚汁', 'チャーハン', 'オムライス',
+    'ハンバーグ', '唐揚げ', '焼き魚', '煮物', 'ポテトサラダ', 'グラタン', 'ナポリタン', 'うどん', 'お好み焼き', '鍋',
+]
+RECIPE_PREFIXES = ['', '基本の', '簡単', '具だくさん', 'さっぱり', 'こってり', '作り置き', '時短']
+UNITS = [('g', [100, 200, 300, 500, 1000]), ('ml', [200, 500, 1000]), ('個', [1, 3, 6, 10])]
+
+
+def unique_names(prefixes, words, count):
+    names = [f"{prefix}{word}" for prefix in prefixes for word in words]
+    result = names[:count]
+    n = 2
+    while len(result) < count:
+        result.extend(f"{name}{n}" for name in names[:count - len(result)])
+        n += 1
+    return result
+
+
+# カタログの生成 ----------------------------------------------------------------------
+def generate_catalog(ingredients, recipes, links, spare, seed):
+    # spare: 削除の計測に使う、どの料理にも使われない食材の数
+    from app import db, Ingredient, IngredientPrice, Recipe, RecipeIngredient, refresh_recipe_costs, bump_catalog_version
+    from reading import get_hiragana_reading
+
+    rng = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+
+    rows = []
+    for name in unique_names(INGREDIENT_PREFIXES, INGREDIENT_WORDS, ingredients + spare):
+        unit, sizes = rng.choice(UNITS)
+        rows.append({'name': name, 'reading': get_hiragana_reading(name), 'unit': unit,
+                     'quantity': rng.choice(sizes), 'price': rng.randint(50, 1500)})
+    db.session.execute(Ingredient.__table__.insert(), rows)
+    ingredient_ids = [id for id, in db.session.query(Ingredient.id).order_by(Ingredient.id)]
+    now = datetime.now()
+    db.session.execute(IngredientPrice.__table__.insert(), [
+        {'ingredient_id': id, 'effective_from': now, 'price': row['price'], 'quantity': row['quantity']}
+        for id, row in zip(ingredient_ids, rows)
+    ])
+    used_ids, spare_ids = ingredient_ids[:ingredients], ingredient_ids[ingredients:]
+
+    names = unique_names(RECIPE_PREFIXES, RECIPE_WORDS, recipes)
+    db.session.execute(Recipe.__table__.insert(), [
+        {'name': name, 'reading': get_hiragana_reading(name), 'servings': rng.randint(1, 4), 'memo': '',
+         'total_cost': 0, 'per_serving_cost': 0}
+        for name in names
+    ])
+    recipe_ids = [id for id, in db.session.query(Recipe.id).order_by(Recipe.id)]
+    per_recipe = max(1, min(links // recipes, len(used_ids)))
+    db.session.execute(RecipeIngredient.__table__.insert(), [
+        {'recipe_id': recipe_id, 'ingredient_id': ingredient_id, 'amount': rng.randint(1, 300), 'factor': 1}
+        for recipe_id in recipe_ids
+        for ingredient_id in rng.sample(used_ids, per_recipe)
+    ])
+    refresh_recipe_costs(Recipe.query.all())
+    db.session.commit()
+    bump_catalog_version()
+    return names, spare_ids
+
+
+# 計測 ----------------------------------------------------------------------
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def measure(client, counter, make_request, iterations):
+    timings = []
+    queries = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        counter.count = 0
+        t = time.perf_counter()
+        response = make_request(i)
+        timings.append(time.perf_counter() - t)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path}: {response.status_code}")
+    elapsed = time.perf_counter() - start
+    return {
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+        'queries': round(sum(queries) / len(queries), 1),
+        'rps': round(iterations / elapsed, 1),
+    }
+
+
+def run_benchmarks(recipe_names, spare_ids, iterations, seed):
+    from app import app, db, Recipe, RecipeIngredient, fragment_cache
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+        recipe_ids = [id for id, in db.session.query(Recipe.id)]
+
+    def update_recipe(i):
+        recipe_id = rng.choice(recipe_ids)
+        with app.app_context():
+            links = db.session.query(RecipeIngredient.ingredient_id, RecipeIngredient.amount).filter_by(recipe_id=recipe_id).all()
+        counter.count = 0  # フォームの準備に使ったクエリは数えない
+        return client.post(f'/update_recipe/{recipe_id}', data={
+            'servings': str(rng.randint(1, 4)), 'memo': '',
+            'ing_id': [str(id) for id, _ in links],
+            'ing_amount': [str(amount + rng.choice([-1, 1])) for _, amount in links],
+        })
+
+    def api_recipes_cold(i):
+        fragment_cache.clear()
+        return client.get('/api/recipes?limit=50')
+
+    routes = {
+        'index': lambda i: client.get('/'),
+        'api_ingredients': lambda i: client.get('/api/ingredients?limit=50'),
+        'api_recipes': lambda i: client.get('/api/recipes?limit=50'),
+        'api_recipes_cold': api_recipes_cold,
+        'get_recipe_cost': lambda i: client.get('/get_recipe_cost/' + quote(rng.choice(recipe_names))),
+        'update_recipe': update_recipe,
+        'delete_ingredient': lambda i: client.post('/delete_ingredient', data={'id': str(spare_ids[i])}),
+    }
+    # リクエストの外でアプリのコンテキストを開いたままにしない。
+    # 開いているとテストクライアントがそれを使い回し、g やセッションがリクエストの間で共有されてしまう
+    results = {}
+    for name, make_request in routes.items():
+        if name != 'delete_ingredient':
+            make_request(0)  # 1回目（キャッシュの準備）は数えない
+        results[name] = measure(client, counter, make_request, iterations)
+    return results
+
+
+# 結果の表示・比較 ----------------------------------------------------------------------
+def print_results(results, baseline=None):
+    print(f"{'route':<20}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'req/s':>9}")
+    for name, r in results.items():
+        line = f"{name:<20}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['queries']:>9}{r['rps']:>9}"
+        if baseline and name in baseline:
+            b = baseline[name]
+            ratio = r['p50_ms'] / b['p50_ms'] if b['p50_ms'] else 1
+            line += f"   p50 ×{ratio:.2f}  queries {b['queries']}→{r['queries']}"
+        print(line)
+
+
+def regressions(results, baseline):
+    found = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b:
+            continue
+        if b['p50_ms'] and r['p50_ms'] / b['p50_ms'] > REGRESSION_RATIO:
+            found.append(f"{name}: p50 {b['p50_ms']}ms → {r['p50_ms']}ms")
+        if r['queries'] > b['queries']:
+            found.append(f"{name}: クエリ数 {b['queries']} → {r['queries']}")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="合成したカタログでルートの応答時間・クエリ数を計測します。")
+    parser.add_argument('--db', help="データベースのURL（省略時は一時ファイルの SQLite）")
+    parser.add_argument('--ingredients', type=int, default=1000, help="食材の数（10〜10000）")
+    parser.add_argument('--recipes', type=int, default=1000, help="料理の数")
+    parser.add_argument('--links', type=int, default=10000, help="料理の材料の行数（10〜50000）")
+    parser.add_argument('--iterations', type=int, default=200, help="ルートごとのリクエスト数")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--name', default='default', help="ベースラインの名前")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--json', action='store_true', help="結果をJSONで出力する")
+    parser.add_argument('--force', action='store_true', help="--db にテーブルがあっても作り直す（中身は消える）")
+    args = parser.parse_args()
+
+    # app は読み込み時に DATABASE_URL を見るので、先に設定する
+    if args.db:
+        os.environ['DATABASE_URL'] = args.db
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from app import app, db
+    from sqlalchemy import inspect
+
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        if tables and not args.force:
+            parser.exit(2, f"{args.db} にはテーブルがあります（{', '.join(tables)}）。"
+                           "カタログを作るときに全て消すので、空のDBを指定するか --force を付けてください。\n")
+        start = time.perf_counter()
+        recipe_names, spare_ids = generate_catalog(args.ingredients, args.recipes, args.links, args.iterations + 1, args.seed)
+        print(f"カタログを作りました（{time.perf_counter() - start:.1f}秒）", file=sys.stderr)
+    results = run_benchmarks(recipe_names, spare_ids, args.iterations, args.seed)
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.name}.json")
+    baseline = None
+    if args.compare:
+        with open(baseline_path, encoding='utf-8') as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        for key, value in saved['params'].items():
+            if getattr(args, key) != value:
+                print(f"⚠ ベースラインと条件が違います: {key} {value} → {getattr(args, key)}", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_results(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': {k: getattr(args, k) for k in ('ingredients', 'recipes', 'links', 'iterations', 'seed')},
+                       'results': results}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"{baseline_path} に保存しました", file=sys.stderr)
+
+    if baseline:
+        found = regressions(results, baseline)
+        for line in found:
+            print("⚠", line)
+        sys.exit(1 if found else 0)
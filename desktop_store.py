@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+
+# デスクトップアプリ（ingredient_app.py）の保存先 ----------------------------------------------------------------------
+# models.py と同じテーブル（ingredient / recipe / recipe_ingredient）をローカルの SQLite（WAL）に置き、
+# 1回の操作で変わった行だけを1トランザクションで書き込む。
+# 以前の ingredients.json / recipes.json は、DBが空のとき最初の1回だけ取り込む。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingredient (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    price FLOAT NOT NULL,
+    quantity FLOAT NOT NULL,
+    unit VARCHAR(20) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipe (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    servings INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipe_ingredient (
+    id INTEGER PRIMARY KEY,
+    recipe_id INTEGER REFERENCES recipe (id),
+    ingredient_id INTEGER REFERENCES ingredient (id),
+    amount FLOAT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_recipe_ingredient_recipe ON recipe_ingredient (recipe_id);
+CREATE INDEX IF NOT EXISTS ix_recipe_ingredient_ingredient ON recipe_ingredient (ingredient_id);
+"""
+
+MIGRATED_VERSION = 1  # PRAGMA user_version。JSONの取り込みが済んだら 1
+
+
+class IngredientInUseError(Exception):
+    pass
+
+
+def recipe_items(data):
+    # 新形式 {"ingredients": [...], "servings": n} と旧形式（材料のリストだけ）の両方を受け付ける
+    if isinstance(data, dict):
+        return data.get("ingredients", []), data.get("servings", 1)
+    return data, 1
+
+
+class IngredientStore:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL ではこれでもクラッシュでDBが壊れない
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.ingredient_ids = dict(self.conn.execute("SELECT name, id FROM ingredient"))
+        self.recipe_ids = dict(self.conn.execute("SELECT name, id FROM recipe"))
+
+    def close(self):
+        self.conn.close()
+
+    # 読み込み（アプリの ingredients_db / recipes_db と同じ形で返す） ----------------------------------------------------------------------
+    def load(self):
+        ingredients = {
+            name: {'price': price, 'quantity': quantity, 'unit': unit}
+            for name, price, quantity, unit in self.conn.execute("SELECT name, price, quantity, unit FROM ingredient")
+        }
+        recipes = {
+            name: {'ingredients': [], 'servings': servings}
+            for name, servings in self.conn.execute("SELECT name, servings FROM recipe")
+        }
+        for recipe_name, ingredient_name, amount in self.conn.execute(
+            "SELECT r.name, i.name, ri.amount FROM recipe_ingredient ri "
+            "JOIN recipe r ON r.id = ri.recipe_id JOIN ingredient i ON i.id = ri.ingredient_id "
+            "ORDER BY ri.id"
+        ):
+            recipes[recipe_name]['ingredients'].append((ingredient_name, amount))
+        return ingredients, recipes
+
+    # 食材 ----------------------------------------------------------------------
+    def save_ingredient(self, name, info):
+        with self.conn:
+            self._upsert_ingredient(name, info)
+
+    def _upsert_ingredient(self, name, info):
+        self.conn.execute(
+            "INSERT INTO ingredient (name, price, quantity, unit) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET price = excluded.price, quantity = excluded.quantity, unit = excluded.unit",
+            (name, info['price'], info['quantity'], info['unit'])
+        )
+        if name not in self.ingredient_ids:
+            self.ingredient_ids[name] = self.conn.execute("SELECT id FROM ingredient WHERE name = ?", (name,)).fetchone()[0]
+
+    def delete_ingredient(self, name):
+        id = self.ingredient_ids.get(name)
+        if id is None:
+            return
+        if self.conn.execute("SELECT 1 FROM recipe_ingredient WHERE ingredient_id = ? LIMIT 1", (id,)).fetchone():
+            raise IngredientInUseError(name)
+        with self.conn:
+            self.conn.execute("DELETE FROM ingredient WHERE id = ?", (id,))
+        del self.ingredient_ids[name]
+
+    # 料理 ----------------------------------------------------------------------
+    def save_recipe(self, name, data):
+        with self.conn:
+            self._upsert_recipe(name, data)
+
+    def _upsert_recipe(self, name, data):
+        items, servings = recipe_items(data)
+        self.conn.execute(
+            "INSERT INTO recipe (name, servings) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET servings = excluded.servings",
+            (name, servings)
+        )
+        if name not in self.recipe_ids:
+            self.recipe_ids[name] = self.conn.execute("SELECT id FROM recipe WHERE name = ?", (name,)).fetchone()[0]
+        recipe_id = self.recipe_ids[name]
+
+        # 材料が変わったときだけ、この料理の材料の行を入れ替える
+        rows = [(self.ingredient_ids[ing_name], float(amount)) for ing_name, amount in items if ing_name in self.ingredient_ids]
+        current = self.conn.execute(
+            "SELECT ingredient_id, amount FROM recipe_ingredient WHERE recipe_id = ? ORDER BY id", (recipe_id,)
+        ).fetchall()
+        if current != rows:
+            self.conn.execute("DELETE FROM recipe_ingredient WHERE recipe_id = ?", (recipe_id,))
+            self.conn.executemany(
+                "INSERT INTO recipe_ingredient (recipe_id, ingredient_id, amount) VALUES (?, ?, ?)",
+                [(recipe_id, ingredient_id, amount) for ingredient_id, amount in rows]
+            )
+        return len(items) - len(rows)  # 未登録で保存しなかった材料の数
+
+    def delete_recipe(self, name):
+        id = self.recipe_ids.pop(name, None)
+        if id is None:
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM recipe_ingredient WHERE recipe_id = ?", (id,))
+            self.conn.execute("DELETE FROM recipe WHERE id = ?", (id,))
+
+    # JSONからの移行 ----------------------------------------------------------------------
+    def migrate_from_json(self, ingredient_file, recipe_file):
+        # 取り込んだ件数と、未登録の食材のため外した材料の数を返す（取り込み済みなら None）
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] >= MIGRATED_VERSION:
+            return None
+        ingredients = recipes = {}
+        if os.path.exists(ingredient_file):
+            with open(ingredient_file, encoding="utf-8") as f:
+                ingredients = json.load(f)
+        if os.path.exists(recipe_file):
+            with open(recipe_file, encoding="utf-8") as f:
+                recipes = json.load(f)
+
+        skipped = 0
+        try:
+            with self.conn:
+                for name, info in ingredients.items():
+                    self._upsert_ingredient(name, info)
+                for name, data in recipes.items():
+                    skipped += self._upsert_recipe(name, data)
+                self.conn.execute(f"PRAGMA user_version = {MIGRATED_VERSION}")
+        except Exception:
+            # ロールバックされた行のidを持ったままにしない
+            self.ingredient_ids = dict(self.conn.execute("SELECT name, id FROM ingredient"))
+            self.recipe_ids = dict(self.conn.execute("SELECT name, id FROM recipe"))
+            raise
+        return len(ingredients), len(recipes), skipped
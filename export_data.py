@@ -0,0 +1,23 @@
+import argparse
+import sys
+from app import app, iter_export_lines, EXPORT_FIELDS
+
+# 食材・料理をコスト付きで書き出すコマンド（夜間の会計連携用）
+#   python export_data.py recipes -o recipes.csv
+#   python export_data.py ingredients --format jsonl
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="食材・料理をコスト付きでCSV/JSON Linesに書き出します。")
+    parser.add_argument('kind', choices=list(EXPORT_FIELDS))
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('-o', '--output', help="出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    with app.app_context():
+        out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for line in iter_export_lines(args.kind, args.format):
+                out.write(line)
+        finally:
+            if args.output:
+                out.close()
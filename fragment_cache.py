@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from threading import Lock
+
+# 描画済みの断片（一覧のJSONなど）のキャッシュ ----------------------------------------------------------------------
+# 鍵にデータの版（食材・料理の番号）を含めるので、書き込み後は古い鍵が使われなくなるだけで済む。
+# FRAGMENT_CACHE_URL=redis://localhost:6379/0 のようにすると Redis 互換のサーバーを使う（ワーカー間で共有）。
+
+FRAGMENT_CACHE_SIZE = 1024  # プロセス内キャッシュの上限件数
+FRAGMENT_CACHE_TTL = 24 * 60 * 60  # Redis に置く断片の有効期限（秒）。古い版の鍵を掃除するため
+
+
+class LRUCache:
+    def __init__(self, maxsize=FRAGMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class RedisCache:
+    def __init__(self, client, prefix='fragment:', ttl=FRAGMENT_CACHE_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_fragment_cache(url=None):
+    if not url:
+        return LRUCache()
+    import redis  # Redis を使うときだけ必要
+    return RedisCache(redis.Redis.from_url(url))
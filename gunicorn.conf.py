@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+
+# gunicorn の設定（gunicorn app:app で自動的に読み込まれる）
+#   GUNICORN_PROFILE=sync|gthread|gevent  （既定は sync）
+#   GUNICORN_WORKERS / GUNICORN_THREADS / GUNICORN_CONNECTIONS で個別に上書きできる
+#
+# DBの接続数の目安: ワーカー数 × (DB_POOL_SIZE + DB_MAX_OVERFLOW) が PostgreSQL の max_connections を超えないように。
+#   sync    : 1ワーカー1リクエスト。DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0 で足りる
+#   gthread : DB_POOL_SIZE をスレッド数に合わせる
+#   gevent  : 同時に DB を使う数が多くなるので DB_POOL_SIZE + DB_MAX_OVERFLOW を worker_connections より小さくして待たせる
+#             （gevent と psycogreen を別途インストールする。psycopg2 を協調動作させないと1接続ずつしか進まない）
+#
+# 計測の例（1 CPU のコンテナ・負荷をかける側も同じCPU、SQLite、食材300・料理500・材料4000行、同時接続8、各20秒）
+#   プロファイル  ワーカー×スレッド  /api/recipes?limit=50          /get_recipe_cost/<name>
+#   sync         3×1                528 req/s  p50 15ms  p99 22ms   238 req/s  p50 33ms p99 56ms
+#   gthread      3×4                467 req/s  p50 16ms  p99 35ms   222 req/s  p50 34ms p99 72ms
+#   gevent       3                  432 req/s  p50 18ms  p99 26ms   209 req/s  p50 39ms p99 55ms
+# CPU だけで済む SQLite では sync が速い。PostgreSQL が別のホストにあって待ち時間が長いときは
+# gthread（スレッド数 ≒ DB待ち時間 / CPU時間 + 1）や gevent を試す。数値は環境で大きく変わるので本番相当のDBで測り直すこと。
+
+# max_requests: 長く動かしたワーカーを入れ替える回数。
+#   gthread・gevent は入れ替え時に受付済みの接続を切ってしまう（計測で 4/12000 件のリセット）ので使わない
+# preload_app: gevent では使わない。親プロセスで読み込むと、エンジンのプールのロックや threading.local
+#   （reading.stats など）がモンキーパッチ前に作られ、接続待ちでハブ全体が止まったり計測値が混ざったりする
+PROFILES = {
+    'sync': {'worker_class': 'sync', 'threads': 1, 'max_requests': 5000, 'preload_app': True},
+    'gthread': {'worker_class': 'gthread', 'threads': 4, 'max_requests': 0, 'preload_app': True},
+    'gevent': {'worker_class': 'gevent', 'threads': 1, 'max_requests': 0, 'preload_app': False},
+}
+
+profile = PROFILES[os.getenv("GUNICORN_PROFILE", "sync")]
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = profile['worker_class']
+threads = int(os.getenv("GUNICORN_THREADS", profile['threads']))
+worker_connections = int(os.getenv("GUNICORN_CONNECTIONS", 100))  # gevent のみ
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# ワーカーの入れ替えは時期をずらし、一斉にDBへ接続し直さないようにする
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", profile['max_requests']))
+max_requests_jitter = max_requests // 10
+
+# アプリを親プロセスで一度だけ読み込み、起動を速くする（gevent 以外）。
+# fork 前に作られた接続を子プロセスで共有しないよう、post_fork でプールを捨てる。
+preload_app = profile['preload_app']
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen がないため psycopg2 は gevent と協調しません")
+
+    if not preload_app:
+        return  # アプリはこの後ワーカーの中で（gevent ならパッチの後に）読み込まれる
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import json
+import time
+from datetime import datetime
+from itertools import groupby, islice
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db, Ingredient, IngredientPrice, Recipe, RecipeIngredient, refresh_recipe_costs, bump_catalog_version
+from app import refresh_factors_for_ingredient
+from reading import get_hiragana_reading
+from units import UnitConversionError
+
+# 食材・料理をまとめて取り込むコマンド
+#   python import_data.py ingredients old/ingredients.json
+#   python import_data.py recipes old/recipes.json
+#
+# CSVの列:
+#   食材: name,price,quantity,unit
+#   料理: recipe,servings,ingredient,amount（1行に材料1つ、同じ料理の行は続けて並べる）
+
+BATCH_SIZE = 500
+
+
+# 入力ファイルの読み込み ----------------------------------------------------------------------
+def read_ingredients(path):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield row['name'], float(row['price']), float(row['quantity']), row['unit']
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        for name, info in data.items():
+            yield name, float(info['price']), float(info['quantity']), info['unit']
+
+
+def read_recipes(path):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for name, rows in groupby(csv.DictReader(f), key=lambda row: row['recipe']):
+                rows = list(rows)
+                items = [(row['ingredient'], float(row['amount'])) for row in rows if row['ingredient']]
+                yield name, int(rows[0]['servings'] or 1), items
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        for name, value in data.items():
+            # 新形式は {"ingredients": [...], "servings": n}、旧形式は材料のリストだけ
+            if isinstance(value, dict):
+                items = value.get("ingredients", [])
+                servings = value.get("servings", 1)
+            else:
+                items = value
+                servings = 1
+            yield name, int(servings), [(ing_name, float(amount)) for ing_name, amount in items]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# まとめて登録（既にあれば更新） ----------------------------------------------------------------------
+def upsert(model, rows, index_elements, update_columns):
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+    db.session.execute(stmt)
+
+
+def import_ingredients(path, batch_size=BATCH_SIZE):
+    count = 0
+    kept_units = set()
+    for chunk in chunked(read_ingredients(path), batch_size):
+        # 同じチャンク内で名前が重なったら後の行を使う
+        rows = {
+            name: {'name': name, 'price': price, 'quantity': quantity, 'unit': unit,
+                   'reading': get_hiragana_reading(name)}
+            for name, price, quantity, unit in chunk
+        }
+        before = {
+            name: (price, quantity, unit)
+            for name, price, quantity, unit in db.session.query(
+                Ingredient.name, Ingredient.price, Ingredient.quantity, Ingredient.unit
+            ).filter(Ingredient.name.in_(rows))
+        }
+        upsert(Ingredient, list(rows.values()), ['name'], ['price', 'quantity', 'unit', 'reading'])
+        refresh_ids = set()
+
+        # 新しい食材・価格が変わった食材だけ価格履歴に追記する
+        changed = [name for name, row in rows.items()
+                   if name not in before or before[name][:2] != (row['price'], row['quantity'])]
+        if changed:
+            now = datetime.now()
+            ids = dict(db.session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(changed)))
+            db.session.execute(IngredientPrice.__table__.insert(), [
+                {'ingredient_id': ids[name], 'effective_from': now,
+                 'price': rows[name]['price'], 'quantity': rows[name]['quantity']}
+                for name in changed
+            ])
+            refresh_ids.update(ids.values())
+
+        # 単位が変わった食材は材料の換算係数を計算し直す（換算できなければ単位は元のままにする）
+        unit_changed = [name for name, row in rows.items() if name in before and before[name][2] != row['unit']]
+        if unit_changed:
+            for ingredient in Ingredient.query.filter(Ingredient.name.in_(unit_changed)):
+                old_unit = before[ingredient.name][2]
+                try:
+                    refresh_factors_for_ingredient(ingredient, old_unit)
+                except UnitConversionError:
+                    ingredient.unit = old_unit
+                    refresh_factors_for_ingredient(ingredient)
+                    kept_units.add(ingredient.name)
+                refresh_ids.add(ingredient.id)
+
+        # 価格・単位が変わった食材を使っている料理だけコストを再計算する
+        if refresh_ids:
+            recipe_ids = db.session.query(RecipeIngredient.recipe_id).filter(RecipeIngredient.ingredient_id.in_(refresh_ids))
+            refresh_recipe_costs(Recipe.query.filter(Recipe.id.in_(recipe_ids)).all())
+        db.session.commit()
+        count += len(chunk)
+
+    if kept_units:
+        print("⚠ 料理で使われている単位を換算できないため単位を変えませんでした:", ", ".join(sorted(kept_units)))
+    return count
+
+
+def import_recipes(path, batch_size=BATCH_SIZE):
+    ingredient_ids = dict(db.session.query(Ingredient.name, Ingredient.id).all())
+    missing = set()
+    count = 0
+    for chunk in chunked(read_recipes(path), batch_size):
+        recipes = {name: (servings, items) for name, servings, items in chunk}
+        upsert(
+            Recipe,
+            [{'name': name, 'servings': servings, 'reading': get_hiragana_reading(name),
+              'total_cost': 0, 'per_serving_cost': 0}
+             for name, (servings, _) in recipes.items()],
+            ['name'],
+            ['servings', 'reading']
+        )
+        recipe_ids = dict(db.session.query(Recipe.name, Recipe.id).filter(Recipe.name.in_(recipes)).all())
+
+        # 材料は入れ替える（同じ食材が複数あれば合算）
+        links = {}
+        for name, (_, items) in recipes.items():
+            for ing_name, amount in items:
+                ing_id = ingredient_ids.get(ing_name)
+                if ing_id is None:
+                    missing.add(ing_name)
+                    continue
+                key = (recipe_ids[name], ing_id)
+                links[key] = links.get(key, 0) + amount
+        db.session.execute(
+            RecipeIngredient.__table__.delete().where(RecipeIngredient.recipe_id.in_(recipe_ids.values()))
+        )
+        if links:
+            db.session.execute(
+                RecipeIngredient.__table__.insert(),
+                [{'recipe_id': recipe_id, 'ingredient_id': ing_id, 'amount': amount}
+                 for (recipe_id, ing_id), amount in links.items()]
+            )
+
+        refresh_recipe_costs(Recipe.query.filter(Recipe.id.in_(recipe_ids.values())).all())
+        db.session.commit()
+        count += len(chunk)
+
+    if missing:
+        print("⚠ 未登録の食材があるため材料から外しました:", ", ".join(sorted(missing)))
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="食材・料理をJSON/CSVからまとめて取り込みます。")
+    parser.add_argument('kind', choices=['ingredients', 'recipes'])
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        if args.kind == 'ingredients':
+            count = import_ingredients(args.path, args.batch_size)
+        else:
+            count = import_recipes(args.path, args.batch_size)
+        bump_catalog_version()
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed > 0 else 0
+        print(f"{count} 件を取り込みました（{elapsed:.2f}秒, {rate:.0f} 件/秒）")
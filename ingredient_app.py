@@ -1,40 +1,60 @@
 import tkinter as tk
 from tkinter import messagebox
-import json
-import os
 from tkinter import ttk
-import pykakasi
-kks = pykakasi.kakasi()
+from bisect import bisect_left
+from reading import get_hiragana_reading
+from desktop_store import IngredientStore, IngredientInUseError, recipe_items
 
 
 # データベースの定義 ------------------------------------------------------------------------------------------------------------------------------------------------------
 ingredients_db = {}
 recipes_db = {}
 
+DB_FILE = "ingredient_app.db"
+# 以前の保存形式（最初の起動時に DB_FILE へ取り込む）
 ING_FILE = "ingredients.json"
 REC_FILE = "recipes.json"
 
+store = IngredientStore(DB_FILE)
 
-# データベースの保存と読み込み ------------------------------------------------------------------------------------------------------------------------------------------------------
-def save_ingredients():
-    with open(ING_FILE, "w", encoding="utf-8") as f:
-        json.dump(ingredients_db, f, ensure_ascii=False, indent=2)
 
-def load_ingredients():
-    global ingredients_db
-    if os.path.exists(ING_FILE):
-        with open(ING_FILE, "r", encoding="utf-8") as f:
-            ingredients_db = json.load(f)
+# データベースの読み込み（保存は操作ごとに store へ変わった行だけ書く） ------------------------------------------------------------------------------------------------------------------------------------------------------
+def load_database():
+    global ingredients_db, recipes_db
+    migrated = store.migrate_from_json(ING_FILE, REC_FILE)
+    if migrated and migrated[2]:
+        messagebox.showwarning("移行", f"未登録の食材を使っていた材料 {migrated[2]} 件は取り込みませんでした。")
+    ingredients_db, recipes_db = store.load()
 
-def save_recipes():
-    with open(REC_FILE, "w", encoding="utf-8") as f:
-        json.dump(recipes_db, f, ensure_ascii=False, indent=2)
 
-def load_recipes():
-    global recipes_db
-    if os.path.exists(REC_FILE):
-        with open(REC_FILE, "r", encoding="utf-8") as f:
-            recipes_db = json.load(f)
+# 一覧の並び順とコストのキャッシュ ------------------------------------------------------------------------------------------------------------------------------------------------------
+# Listbox の i 行目は ingredient_order[i] / recipe_order[i] の名前。追加・更新・削除では変わった行だけを入れ替える
+ingredient_order = []  # (よみがな, 名前) の昇順
+recipe_order = []
+recipe_costs = {}  # 料理名 -> 合計コスト
+ingredient_users = {}  # 食材名 -> その食材を使っている料理名の集合
+recipe_ingredient_names = {}  # 料理名 -> 使っている食材名の集合（ingredient_users の逆）
+
+
+def set_row(order, box, name, text):
+    # 並び順の位置に行を入れる（既にあれば置き換える）。新しく入れたら True
+    key = (get_hiragana_reading(name), name)
+    index = bisect_left(order, key)
+    is_new = not (index < len(order) and order[index] == key)
+    if is_new:
+        order.insert(index, key)
+    else:
+        box.delete(index)
+    box.insert(index, text)
+    return is_new
+
+
+def remove_row(order, box, name):
+    key = (get_hiragana_reading(name), name)
+    index = bisect_left(order, key)
+    if index < len(order) and order[index] == key:
+        del order[index]
+        box.delete(index)
 
 
 # メモ情報 ------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -46,12 +66,6 @@ MEMO_TEXT = (
 )
 
 
-# 50音順に並び変える関数 ------------------------------------------------------------------------------------------------------------------------------------------------------
-def get_hiragana_reading(text):
-    result = kks.convert(text)
-    return ''.join([item['hira'] for item in result])
-
-
 # 食材登録に関する関数群 ------------------------------------------------------------------------------------------------------------------------------------------------------
 
 # 食材を登録する関数 ----------------------------------------------------------------------
@@ -78,8 +92,8 @@ def register_ingredient():
         'unit': unit
     }
 
-    save_ingredients()
-    update_ingredient_list()
+    store.save_ingredient(name, ingredients_db[name])
+    refresh_ingredient(name)
     clear_ingredient_inputs()
     messagebox.showinfo("登録完了", f"{name} を登録しました。")
 
@@ -92,18 +106,39 @@ def clear_ingredient_inputs():
     unit_entry.delete(0, tk.END)
 
 
-# 食材リストを更新する関数 ----------------------------------------------------------------------
+# 食材リストを作り直す関数（起動時） ----------------------------------------------------------------------
 def update_ingredient_list():
     listbox.delete(0, tk.END)
 
     # 読み仮名をキーにしてソート
-    sorted_names = sorted(ingredients_db.keys(), key=get_hiragana_reading)
+    ingredient_order[:] = sorted((get_hiragana_reading(name), name) for name in ingredients_db)
+
+    for _, name in ingredient_order:
+        listbox.insert(tk.END, ingredient_row_text(name))
 
-    for name in sorted_names:
-        info = ingredients_db[name]
-        listbox.insert(tk.END, f"{name}: {info['price']}円 / {info['quantity']}{info['unit']}")
+    update_ingredient_choices()
+
+
+def ingredient_row_text(name):
+    info = ingredients_db[name]
+    return f"{name}: {info['price']}円 / {info['quantity']}{info['unit']}"
+
+
+def update_ingredient_choices():
+    recipe_ing_name_entry['values'] = [name for _, name in ingredient_order]
+
+
+# 食材1件の行と、その食材を使っている料理の行だけを更新する関数 ----------------------------------------------------------------------
+def refresh_ingredient(name):
+    if name in ingredients_db:
+        if set_row(ingredient_order, listbox, name, ingredient_row_text(name)):
+            update_ingredient_choices()
+    else:
+        remove_row(ingredient_order, listbox, name)
+        update_ingredient_choices()
 
-    recipe_ing_name_entry['values'] = sorted_names
+    for recipe in list(ingredient_users.get(name, ())):
+        refresh_recipe(recipe)
 
 
 # 選択した食材の情報をロードする関数 ----------------------------------------------------------------------
@@ -152,8 +187,8 @@ def update_ingredient():
         'unit': unit
     }
 
-    save_ingredients()
-    update_ingredient_list()
+    store.save_ingredient(name, ingredients_db[name])
+    refresh_ingredient(name)
     clear_ingredient_inputs()
     messagebox.showinfo("更新完了", f"{name} を更新しました。")
 
@@ -173,9 +208,13 @@ def remove_ingredient():
         return
 
     if name in ingredients_db:
+        try:
+            store.delete_ingredient(name)
+        except IngredientInUseError:
+            messagebox.showerror("エラー", f"{name} は料理に使用されています。削除できません。")
+            return
         del ingredients_db[name]
-        save_ingredients()
-        update_ingredient_list()
+        refresh_ingredient(name)
         clear_ingredient_inputs()
         messagebox.showinfo("削除完了", f"{name} を削除しました。")
 
@@ -241,8 +280,8 @@ def register_recipe():
         "servings": servings
 }
 
-    save_recipes()
-    update_recipe_list()
+    store.save_recipe(recipe_name, recipes_db[recipe_name])
+    refresh_recipe(recipe_name)
     current_ingredients.clear()
     update_current_recipe_list()
     recipe_name_entry.delete(0, tk.END)
@@ -252,31 +291,59 @@ def register_recipe():
     cost_label.config(text=cost_text)
 
 
-# レシピのデータベースを更新する関数 ----------------------------------------------------------------------
+# レシピのリストを作り直す関数（起動時） ----------------------------------------------------------------------
 def update_recipe_list():
     recipe_listbox_all.delete(0, tk.END)
 
     # 料理名を50音順にソート（漢字・ひらがな・カタカナ混在でもOK）
-    sorted_recipes = sorted(recipes_db.items(), key=lambda item: get_hiragana_reading(item[0]))
+    recipe_order[:] = sorted((get_hiragana_reading(recipe), recipe) for recipe in recipes_db)
+    ingredient_users.clear()
+    recipe_ingredient_names.clear()
 
-    for recipe, data in sorted_recipes:
-        if isinstance(data, dict):
-            items = data.get("ingredients", [])
-            servings = data.get("servings", 1)
-        else:
-            items = data
-            servings = 1
+    for _, recipe in recipe_order:
+        index_recipe_ingredients(recipe)
+        recipe_costs[recipe] = calculate_total_cost(recipe)
+        recipe_listbox_all.insert(tk.END, recipe_row_text(recipe))
 
-        total_cost = 0
-        for ing_name, amount in items:
-            info = ingredients_db.get(ing_name)
-            if info:
-                unit_price = info['price'] / info['quantity']
-                total_cost += unit_price * amount
 
-        recipe_listbox_all.insert(
-            tk.END, f"{recipe}（合計{total_cost:.0f}円／{servings}食）"
-        )
+def calculate_total_cost(recipe):
+    items, _ = recipe_items(recipes_db[recipe])
+    total_cost = 0
+    for ing_name, amount in items:
+        info = ingredients_db.get(ing_name)
+        if info:
+            unit_price = info['price'] / info['quantity']
+            total_cost += unit_price * amount
+    return total_cost
+
+
+def recipe_row_text(recipe):
+    _, servings = recipe_items(recipes_db[recipe])
+    return f"{recipe}（合計{recipe_costs[recipe]:.0f}円／{servings}食）"
+
+
+def index_recipe_ingredients(recipe):
+    items, _ = recipe_items(recipes_db[recipe])
+    recipe_ingredient_names[recipe] = {ing_name for ing_name, _ in items}
+    for ing_name in recipe_ingredient_names[recipe]:
+        ingredient_users.setdefault(ing_name, set()).add(recipe)
+
+
+def unindex_recipe_ingredients(recipe):
+    for ing_name in recipe_ingredient_names.pop(recipe, ()):
+        ingredient_users[ing_name].discard(recipe)
+
+
+# 料理1件のコストと行だけを更新する関数 ----------------------------------------------------------------------
+def refresh_recipe(recipe):
+    unindex_recipe_ingredients(recipe)
+    if recipe in recipes_db:
+        index_recipe_ingredients(recipe)
+        recipe_costs[recipe] = calculate_total_cost(recipe)
+        set_row(recipe_order, recipe_listbox_all, recipe, recipe_row_text(recipe))
+    else:
+        recipe_costs.pop(recipe, None)
+        remove_row(recipe_order, recipe_listbox_all, recipe)
 
 
 # 選択した料理の情報をロードする関数 ----------------------------------------------------------------------
@@ -292,13 +359,7 @@ def load_selected_recipe():
     if not data:
         return
 
-    # データが辞書（新形式）かリスト（旧形式）かを判定
-    if isinstance(data, dict):
-        items = data.get("ingredients", [])
-        servings = data.get("servings", 1)
-    else:
-        items = data
-        servings = 1
+    items, servings = recipe_items(data)
 
     # フォームに反映
     recipe_name_entry.delete(0, tk.END)
@@ -329,8 +390,8 @@ def update_recipe():
         return
 
     recipes_db[recipe_name] = current_ingredients.copy()
-    save_recipes()
-    update_recipe_list()
+    store.save_recipe(recipe_name, recipes_db[recipe_name])
+    refresh_recipe(recipe_name)
     current_ingredients.clear()
     update_current_recipe_list()
     recipe_name_entry.delete(0, tk.END)
@@ -375,21 +436,15 @@ def remove_selected_recipe():
 
     if recipe_name in recipes_db:
         del recipes_db[recipe_name]
-        save_recipes()
-        update_recipe_list()
+        store.delete_recipe(recipe_name)
+        refresh_recipe(recipe_name)
         cost_label.config(text="ここにコストが表示されます")
         messagebox.showinfo("削除完了", f"{recipe_name} を削除しました。")
 
 
 # レシピのコストを計算する関数 ----------------------------------------------------------------------
 def calculate_recipe_cost_text(recipe_name):
-    data = recipes_db.get(recipe_name)
-    if isinstance(data, dict):
-        items = data.get("ingredients", [])
-        servings = data.get("servings", 1)
-    else:
-        items = data
-        servings = 1
+    items, servings = recipe_items(recipes_db.get(recipe_name))
 
     total_cost = 0
     details = []
@@ -528,8 +583,7 @@ memo_label.grid(row=2, column=0, columnspan=2, padx=10, sticky='w')
 
 
 # データ読み込みと初期表示 ----------------------------------------------------------------------------------------------------------------------------------------------------------------------
-load_ingredients()
-load_recipes()
+load_database()
 update_ingredient_list()
 update_recipe_list()
 
@@ -0,0 +1,68 @@
+from bisect import bisect_left, insort
+from threading import Lock
+import jaconv
+from reading import get_hiragana_reading, get_romaji_reading
+
+
+# 入力をカタカナ→ひらがな・小文字にそろえる
+def normalize(text):
+    return jaconv.kata2hira(text.strip()).lower()
+
+
+# 食材名・よみがな・ローマ字の前方一致で食材を探す索引 ----------------------------------------------------------------------
+# (キー, id) のソート済みリストを bisect で引く。追加・削除は差分で反映する。
+class IngredientIndex:
+    def __init__(self):
+        self.keys = []
+        self.items = {}  # id -> (名前, 単位)
+        self.fingerprint = None  # 作成時点のDBの状態（アプリ側で設定）
+        self.lock = Lock()
+
+    def _keys_for(self, name):
+        return {normalize(name), get_hiragana_reading(name), get_romaji_reading(name)}
+
+    def rebuild(self, rows):
+        items = {id: (name, unit) for id, name, unit in rows}
+        keys = sorted({(key, id) for id, (name, _) in items.items() for key in self._keys_for(name)})
+        with self.lock:
+            self.items = items
+            self.keys = keys
+
+    def add(self, id, name, unit):
+        with self.lock:
+            self._remove(id)
+            self.items[id] = (name, unit)
+            for key in self._keys_for(name):
+                insort(self.keys, (key, id))
+
+    def remove(self, id):
+        with self.lock:
+            self._remove(id)
+
+    def _remove(self, id):
+        item = self.items.pop(id, None)
+        if not item:
+            return
+        for key in self._keys_for(item[0]):
+            i = bisect_left(self.keys, (key, id))
+            if i < len(self.keys) and self.keys[i] == (key, id):
+                del self.keys[i]
+
+    def search(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self.lock:
+            i = bisect_left(self.keys, (prefix,))
+            while i < len(self.keys) and len(results) < limit:
+                key, id = self.keys[i]
+                if not key.startswith(prefix):
+                    break
+                if id not in seen:
+                    seen.add(id)
+                    name, unit = self.items[id]
+                    results.append({'id': id, 'name': name, 'unit': unit})
+                i += 1
+        return results
@@ -1,3 +1,22 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# 料理のコストをまとめて計算するコマンド（書き出したカタログのオフライン監査用）
+#   python kakeibo.py old/ingredients.json old/recipes.json
+#   python kakeibo.py ingredients.json recipes.json --workers 4 --chunk-size 2000 --format csv -o costs.csv
+#
+# ファイルの形は old/ と同じ:
+#   食材: {"名前": {"price": 価格, "quantity": 購入量, "unit": 単位}, ...}
+#   料理: {"名前": {"ingredients": [[食材名, 使用量], ...], "servings": 食数}, ...}（旧形式の材料のリストだけでもよい）
+
+CHUNK_SIZE = 1000  # 1回にワーカーへ渡す料理の数
+OUTPUT_FIELDS = ['recipe', 'servings', 'total', 'per_serving', 'missing']
+
 # --- ステップ1の食材DB ---
 ingredients_db = {}
 
@@ -66,13 +85,107 @@ def calculate_recipe_cost(recipe_name):
     return total_cost
 
 
+# --- まとめて計算（CLI） ---
+def load_ingredients(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_recipes(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    for name, value in data.items():
+        if isinstance(value, dict):
+            yield name, value.get("ingredients", []), value.get("servings", 1)
+        else:
+            yield name, value, 1
+
+
+def evaluate_recipe(name, items, servings, ingredients):
+    total_cost = 0
+    missing = []
+    for ing_name, used_amount in items:
+        ingredient = ingredients.get(ing_name)
+        if not ingredient:
+            missing.append(ing_name)
+            continue
+        total_cost += ingredient['price'] / ingredient['quantity'] * used_amount
+    return {
+        'recipe': name,
+        'servings': servings,
+        'total': round(total_cost, 2),
+        'per_serving': round(total_cost / servings, 2) if servings > 0 else 0,
+        'missing': missing,
+    }
+
+
+# ワーカーには食材の辞書を起動時に1回だけ渡し、料理はチャンク単位で送る
+worker_ingredients = {}
+
 
-# --- 使用例 ---
-register_ingredient("キャベツ", 200, 1, "個")
-register_ingredient("たまねぎ", 100, 1, "個")
-register_ingredient("醤油", 300, 500, "ml")
+def init_worker(ingredients):
+    global worker_ingredients
+    worker_ingredients = ingredients
 
-register_recipe("野菜炒め", [("キャベツ", 1), ("たまねぎ", 2), ("醤油", 15)])  # 大さじ1 = 約15ml
 
+def evaluate_chunk(chunk):
+    return [evaluate_recipe(name, items, servings, worker_ingredients) for name, items, servings in chunk]
 
-calculate_recipe_cost("野菜炒め")
\ No newline at end of file
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def evaluate_all(ingredients, recipes, workers=1, chunk_size=CHUNK_SIZE):
+    # 入力の順番のまま結果を返す
+    if workers <= 1:
+        for name, items, servings in recipes:
+            yield evaluate_recipe(name, items, servings, ingredients)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(ingredients,)) as pool:
+        for results in pool.map(evaluate_chunk, chunked(recipes, chunk_size)):
+            yield from results
+
+
+def write_results(results, fmt, out):
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(OUTPUT_FIELDS)
+        for row in results:
+            writer.writerow([row['recipe'], row['servings'], row['total'], row['per_serving'], ';'.join(row['missing'])])
+            yield row
+    else:
+        for row in results:
+            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            yield row
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="食材・料理のJSONから、料理ごとのコストをまとめて計算します。")
+    parser.add_argument('ingredients', help="食材のJSON")
+    parser.add_argument('recipes', help="料理のJSON")
+    parser.add_argument('--workers', type=int, default=1, help="プロセス数（1ならプロセスを増やさない）")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('-o', '--output', help="出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ingredients = load_ingredients(args.ingredients)
+    results = evaluate_all(ingredients, load_recipes(args.recipes), args.workers, args.chunk_size)
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    count = missing = 0
+    try:
+        for row in write_results(results, args.format, out):
+            count += 1
+            missing += bool(row['missing'])
+    finally:
+        if args.output:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f"{count} 件を計算しました（未登録の食材を含む料理 {missing} 件、{elapsed:.2f}秒, {rate:.0f} 件/秒）", file=sys.stderr)
@@ -0,0 +1,68 @@
+from bisect import bisect_left
+from threading import Lock
+
+# リクエストの計測値を Prometheus のテキスト形式で出すためのヒストグラム ----------------------------------------------------------------------
+# 値はプロセスごとに持つ（gunicorn のワーカーが複数あれば、ワーカーごとの値になる）。
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, label='route'):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self.series = {}  # ラベルの値 -> [バケットごとの件数..., 合計, 件数]
+        self.lock = Lock()
+
+    def observe(self, label_value, value):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [0] * (len(self.buckets) + 2)
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((label_value, list(series)) for label_value, series in self.series.items())
+        for label_value, series in items:
+            label = f'{self.label}="{escape_label(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {series[-1]}')
+        return '\n'.join(lines)
+
+
+class CallbackMetric:
+    # 呼び出した時点の値をそのまま出すカウンター・ゲージ（collect は {ラベルの値: 値} を返す関数）
+    def __init__(self, name, help, type, collect, label='cache'):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.collect = collect
+        self.label = label
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for label_value, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{{{self.label}="{escape_label(label_value)}"}} {value}')
+        return '\n'.join(lines)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(metrics):
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
@@ -0,0 +1,152 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from app import app, db, Ingredient, IngredientPrice, Recipe, RecipeIngredient, refresh_recipe_costs, bump_catalog_version
+from reading import get_hiragana_reading
+
+# 既存のデータベースを現在のモデル定義に合わせる（何度実行してもよい）
+
+
+def add_column(table, column, ddl):
+    columns = [c['name'] for c in inspect(db.engine).get_columns(table)]
+    if column in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    print(f"{table}.{column} 列を追加しました。")
+
+
+def create_index(name, table, columns):
+    with db.engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# 列・インデックスの追加 ----------------------------------------------------------------------
+def migrate_schema():
+    db.create_all()  # 新しいテーブルだけ作られる
+
+    for table in ('ingredient', 'recipe'):
+        add_column(table, 'reading', "VARCHAR(200)")
+        create_index(f"ix_{table}_reading", table, "reading")
+
+    add_column('recipe', 'total_cost', "FLOAT NOT NULL DEFAULT 0")
+    add_column('recipe', 'per_serving_cost', "FLOAT NOT NULL DEFAULT 0")
+
+    migrate_recipe_ingredient_constraints()
+
+    # 単位の換算（作り直したテーブルには既にある）
+    add_column('ingredient', 'density', "FLOAT")
+    add_column('recipe_ingredient', 'unit', "VARCHAR(20)")
+    add_column('recipe_ingredient', 'factor', "FLOAT NOT NULL DEFAULT 1")
+
+    # 一覧ごとの版（条件付きGET・断片キャッシュ用）
+    add_column('catalog_version', 'ingredients_version', "INTEGER NOT NULL DEFAULT 0")
+    add_column('catalog_version', 'recipes_version', "INTEGER NOT NULL DEFAULT 0")
+
+
+# 料理×食材の一意制約・インデックス・ON DELETE CASCADE ----------------------------------------------------------------------
+def merge_duplicate_links():
+    # 同じ料理×食材の行が複数あれば使用量を合算して1行にする
+    duplicates = (
+        db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id)
+        .group_by(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id)
+        .having(db.func.count() > 1)
+        .all()
+    )
+    table = RecipeIngredient.__table__
+    for recipe_id, ingredient_id in duplicates:
+        links = (
+            db.session.query(table.c.id, table.c.amount)
+            .filter_by(recipe_id=recipe_id, ingredient_id=ingredient_id)
+            .order_by(table.c.id)
+            .all()
+        )
+        db.session.execute(table.update().where(table.c.id == links[0].id).values(amount=sum(link.amount for link in links)))
+        db.session.execute(table.delete().where(table.c.id.in_([link.id for link in links[1:]])))
+    db.session.commit()
+    if duplicates:
+        print(f"recipe_ingredient: {len(duplicates)} 組の重複をまとめました。")
+
+
+def migrate_recipe_ingredient_constraints():
+    inspector = inspect(db.engine)
+    unique_names = [c['name'] for c in inspector.get_unique_constraints('recipe_ingredient')]
+    unique_names += [i['name'] for i in inspector.get_indexes('recipe_ingredient') if i['unique']]
+    if 'uq_recipe_ingredient' in unique_names:
+        return
+
+    merge_duplicate_links()
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_recipe_ingredient_ingredient_id"))
+        if db.engine.dialect.name == 'sqlite':
+            # SQLiteは制約を変更できないのでテーブルを作り直す（参照先のない行は捨てる）
+            conn.execute(text("ALTER TABLE recipe_ingredient RENAME TO recipe_ingredient_old"))
+            RecipeIngredient.__table__.create(conn)
+            conn.execute(text(
+                "INSERT INTO recipe_ingredient (id, recipe_id, ingredient_id, amount) "
+                "SELECT id, recipe_id, ingredient_id, amount FROM recipe_ingredient_old "
+                "WHERE recipe_id IN (SELECT id FROM recipe) AND ingredient_id IN (SELECT id FROM ingredient)"
+            ))
+            conn.execute(text("DROP TABLE recipe_ingredient_old"))
+        else:
+            for fk in inspector.get_foreign_keys('recipe_ingredient'):
+                if fk['referred_table'] == 'recipe':
+                    conn.execute(text(f"ALTER TABLE recipe_ingredient DROP CONSTRAINT {fk['name']}"))
+            conn.execute(text(
+                "ALTER TABLE recipe_ingredient ADD CONSTRAINT recipe_ingredient_recipe_id_fkey "
+                "FOREIGN KEY (recipe_id) REFERENCES recipe (id) ON DELETE CASCADE"
+            ))
+            conn.execute(text(
+                "ALTER TABLE recipe_ingredient ADD CONSTRAINT uq_recipe_ingredient UNIQUE (recipe_id, ingredient_id)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_recipe_ingredient_ingredient_recipe ON recipe_ingredient (ingredient_id, recipe_id)"
+            ))
+    print("recipe_ingredient に一意制約・インデックス・ON DELETE CASCADE を追加しました。")
+
+
+# よみがなの埋め込み ----------------------------------------------------------------------
+def backfill_reading():
+    for model in (Ingredient, Recipe):
+        count = 0
+        for row in model.query.all():
+            reading = get_hiragana_reading(row.name)
+            if row.reading != reading:
+                row.reading = reading
+                count += 1
+        db.session.commit()
+        print(f"{model.__tablename__}: {count} 件のよみがなを更新しました。")
+
+
+# 価格履歴の初期値（履歴のない食材は現在の価格を今日から有効とする） ----------------------------------------------------------------------
+def backfill_price_history():
+    now = datetime.now()
+    has_history = db.session.query(IngredientPrice.ingredient_id)
+    rows = (
+        db.session.query(Ingredient.id, Ingredient.price, Ingredient.quantity)
+        .filter(Ingredient.id.notin_(has_history))
+        .all()
+    )
+    if rows:
+        db.session.execute(IngredientPrice.__table__.insert(), [
+            {'ingredient_id': id, 'effective_from': now, 'price': price, 'quantity': quantity}
+            for id, price, quantity in rows
+        ])
+    db.session.commit()
+    print(f"ingredient_price: {len(rows)} 件の価格履歴を追加しました。")
+
+
+# コストの再計算 ----------------------------------------------------------------------
+def backfill_recipe_costs():
+    recipes = Recipe.query.all()
+    refresh_recipe_costs(recipes)
+    db.session.commit()
+    print(f"recipe: {len(recipes)} 件のコストを再計算しました。")
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        migrate_schema()
+        backfill_reading()
+        backfill_price_history()
+        backfill_recipe_costs()
+        bump_catalog_version()  # 条件付きGETのキャッシュを無効にする
@@ -0,0 +1,37 @@
+import argparse
+import json
+from app import app, plan_meals
+from planner import PlanError
+
+# 予算内で1週間分の献立を作るコマンド
+#   python plan_meals.py --meals 7 --people 2
+#   python plan_meals.py --meals 14 --budget 8000 --mode variety --json
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="登録済みの料理から、買い物の支出が少ない献立を作ります。")
+    parser.add_argument('--meals', type=int, default=7, help="作る回数")
+    parser.add_argument('--people', type=int, default=1, help="1回あたりの食数")
+    parser.add_argument('--max-repeat', type=int, default=2, help="同じ料理を作る上限回数")
+    parser.add_argument('--budget', type=float, help="予算（円）")
+    parser.add_argument('--mode', choices=['cost', 'variety'], default='cost')
+    parser.add_argument('--json', action='store_true', help="JSONで出力する")
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            plan = plan_meals(args.meals, args.people, args.max_repeat, args.budget, args.mode)
+        except PlanError as e:
+            parser.exit(1, f"⚠ {e}\n")
+
+    if args.json:
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
+    else:
+        print("■ 献立")
+        for recipe in plan['recipes']:
+            print(f"  {recipe['name']} × {recipe['count']}")
+        print("■ 買い物")
+        for item in plan['shopping']:
+            print(f"  {item['name']}: {item['packages']}個（{item['used']}{item['unit']} 使用） {item['spend']}円")
+        print(f"支出 {plan['spend']}円 / 使う分 {plan['consumed']}円")
+        if not plan['within_budget']:
+            print("⚠ 予算内に収まる献立が見つかりませんでした")
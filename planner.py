@@ -0,0 +1,140 @@
+import math
+from time import monotonic
+
+# 献立の自動作成 ----------------------------------------------------------------------
+# 料理を meals 回分選び、買う食材のパック数（Ingredient.quantity 単位で切り上げ）の合計金額を最小にする。
+# 同じ食材は料理の間で使い回す（余ったパックを次の料理に回す）。
+#   mode='cost'    : 予算内で支出を最小に
+#   mode='variety' : 予算内で料理の種類を最大に（同数なら支出が少ない方）
+# 貪欲法で作った献立を、1回分ずつ別の料理に入れ替える局所探索で改善する（時間・回数に上限あり）。
+
+PACKAGE_EPSILON = 1e-9  # 使用量がちょうどパックの倍数のとき、浮動小数の誤差で1パック増えないように
+
+
+class PlanError(ValueError):
+    pass
+
+
+def package_count(used, quantity):
+    if used <= 0:
+        return 0
+    return math.ceil(used / quantity - PACKAGE_EPSILON)
+
+
+def package_cost(used, price, quantity):
+    # quantity が 0 以下の食材は量り売りとみなす
+    if quantity <= 0:
+        return 0
+    return package_count(used, quantity) * price
+
+
+class MealPlanner:
+    def __init__(self, recipes, rows, ingredients):
+        # recipes: [(id, 名前, 食数)]、rows: {料理id: {食材id: 使用量}}（部品の料理は展開済み）
+        # ingredients: {食材id: (価格, 購入量)}
+        self.ingredients = ingredients
+        self.recipes = []
+        self.usage = []  # 料理ごとの1食あたりの使用量 [(食材id, 量)]
+        for id, name, servings in recipes:
+            row = rows.get(id, {})
+            if servings <= 0 or not row:
+                continue
+            self.recipes.append((id, name))
+            self.usage.append([(ingredient_id, amount / servings) for ingredient_id, amount in row.items()
+                               if ingredient_id in ingredients])
+
+    def _change_cost(self, used, changes):
+        # changes: {食材id: 増減量} を適用したときの支出の増減
+        delta = 0
+        for ingredient_id, amount in changes.items():
+            price, quantity = self.ingredients[ingredient_id]
+            before = used.get(ingredient_id, 0)
+            delta += package_cost(before + amount, price, quantity) - package_cost(before, price, quantity)
+        return delta
+
+    def _changes(self, add=None, remove=None, people=1):
+        changes = {}
+        if add is not None:
+            for ingredient_id, amount in self.usage[add]:
+                changes[ingredient_id] = changes.get(ingredient_id, 0) + amount * people
+        if remove is not None:
+            for ingredient_id, amount in self.usage[remove]:
+                changes[ingredient_id] = changes.get(ingredient_id, 0) - amount * people
+        return changes
+
+    def _score(self, spend, distinct, budget, mode):
+        over = max(spend - budget, 0) if budget is not None else 0
+        return over, -distinct if mode == 'variety' else 0, spend
+
+    def plan(self, meals, people=1, max_repeat=2, budget=None, mode='cost', time_limit=0.5, max_passes=20):
+        if mode not in ('cost', 'variety'):
+            raise PlanError("mode は cost か variety を指定してください。")
+        if meals <= 0 or people <= 0 or max_repeat <= 0:
+            raise PlanError("回数・人数・繰り返し回数は1以上を指定してください。")
+        if len(self.recipes) * max_repeat < meals:
+            raise PlanError("材料が登録された料理が足りません。")
+
+        deadline = monotonic() + time_limit
+        counts = [0] * len(self.recipes)
+        used = {}
+        slots = []
+        spend = 0
+        distinct = 0  # 献立に入っている料理の種類
+
+        def apply(changes):
+            for ingredient_id, amount in changes.items():
+                used[ingredient_id] = used.get(ingredient_id, 0) + amount
+
+        # 貪欲法：1回分ずつ、評価が最もよくなる料理を足す
+        for _ in range(meals):
+            best = None
+            for r in range(len(self.recipes)):
+                if counts[r] >= max_repeat:
+                    continue
+                changes = self._changes(add=r, people=people)
+                new_spend = spend + self._change_cost(used, changes)
+                score = self._score(new_spend, distinct + (counts[r] == 0), budget, mode)
+                if best is None or score < best[0]:
+                    best = (score, r, changes, new_spend)
+            _, r, changes, spend = best
+            apply(changes)
+            distinct += counts[r] == 0
+            counts[r] += 1
+            slots.append(r)
+
+        # 局所探索：1回分を別の料理に替えて良くなれば採用する
+        score = self._score(spend, distinct, budget, mode)
+        for _ in range(max_passes):
+            improved = False
+            for i, old in enumerate(slots):
+                for r in range(len(self.recipes)):
+                    if r == old or counts[r] >= max_repeat:
+                        continue
+                    changes = self._changes(add=r, remove=old, people=people)
+                    new_spend = spend + self._change_cost(used, changes)
+                    new_distinct = distinct + (counts[r] == 0) - (counts[old] == 1)
+                    new_score = self._score(new_spend, new_distinct, budget, mode)
+                    if new_score < score:
+                        apply(changes)
+                        counts[old] -= 1
+                        counts[r] += 1
+                        slots[i] = old = r
+                        spend, distinct, score = new_spend, new_distinct, new_score
+                        improved = True
+                if monotonic() > deadline:
+                    break
+            if not improved or monotonic() > deadline:
+                break
+
+        spend = sum(package_cost(amount, *self.ingredients[ingredient_id]) for ingredient_id, amount in used.items())
+        consumed = sum(
+            self.ingredients[ingredient_id][0] / self.ingredients[ingredient_id][1] * amount
+            for ingredient_id, amount in used.items() if self.ingredients[ingredient_id][1] > 0
+        )
+        return {
+            'recipes': [(self.recipes[r][0], self.recipes[r][1], count) for r, count in enumerate(counts) if count],
+            'used': {ingredient_id: amount for ingredient_id, amount in used.items() if amount > PACKAGE_EPSILON},
+            'spend': spend,
+            'consumed': consumed,
+            'within_budget': budget is None or spend <= budget,
+        }
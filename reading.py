@@ -0,0 +1,49 @@
+from functools import lru_cache
+from threading import local
+from time import perf_counter
+import pykakasi
+
+kks = pykakasi.kakasi()
+stats = local()  # スレッドごとの変換時間（リクエスト単位の計測用）
+
+# 同じ名前を何度も変換しないようにキャッシュする（上限付き・スレッドセーフ）
+READING_CACHE_SIZE = 4096
+
+
+# 50音順に並び変えるためのよみがなを返す関数 ----------------------------------------------------------------------
+def convert(text):
+    # 実際に pykakasi で変換した時間だけを足していく（キャッシュに当たった分は含まない）
+    start = perf_counter()
+    result = kks.convert(text)
+    stats.seconds = getattr(stats, 'seconds', 0.0) + perf_counter() - start
+    return result
+
+
+@lru_cache(maxsize=READING_CACHE_SIZE)
+def get_hiragana_reading(text):
+    result = convert(text)
+    return ''.join([item['hira'] for item in result])
+
+
+# ローマ字のよみを返す関数（検索用） ----------------------------------------------------------------------
+@lru_cache(maxsize=READING_CACHE_SIZE)
+def get_romaji_reading(text):
+    result = convert(text)
+    return ''.join([item['hepburn'] for item in result]).lower()
+
+
+# キャッシュごとのヒット数・ミス数を返す関数（/metrics で出す） ----------------------------------------------------------------------
+def reading_cache_info():
+    caches = {'hiragana': get_hiragana_reading, 'romaji': get_romaji_reading}
+    result = {}
+    for name, cached in caches.items():
+        info = cached.cache_info()
+        result[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+    return result
+
+
+# このスレッドで変換にかかった時間（秒）を返して 0 に戻す ----------------------------------------------------------------------
+def take_conversion_time():
+    seconds = getattr(stats, 'seconds', 0.0)
+    stats.seconds = 0.0
+    return seconds
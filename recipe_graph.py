@@ -0,0 +1,87 @@
+from collections import defaultdict
+
+# 料理の部品関係（親の料理が子の料理を材料として使う）のグラフ ----------------------------------------------------------------------
+# edges は (親id, 子id, 量) のリスト。循環は許さない（DAG）。
+
+
+class RecipeCycleError(ValueError):
+    pass
+
+
+def children_map(edges):
+    children = defaultdict(list)
+    for parent, child, amount in edges:
+        children[parent].append((child, amount))
+    return children
+
+
+def parents_map(edges):
+    parents = defaultdict(set)
+    for parent, child, _ in edges:
+        parents[child].add(parent)
+    return parents
+
+
+# 指定した料理と、それを（間接的にでも）使っている料理のid ----------------------------------------------------------------------
+def with_dependents(recipe_ids, edges):
+    parents = parents_map(edges)
+    result = set(recipe_ids)
+    stack = list(recipe_ids)
+    while stack:
+        for parent in parents[stack.pop()]:
+            if parent not in result:
+                result.add(parent)
+                stack.append(parent)
+    return result
+
+
+# 指定した料理と、その部品（間接的なものも含む）のid ----------------------------------------------------------------------
+def with_components(recipe_ids, edges):
+    children = children_map(edges)
+    result = set(recipe_ids)
+    stack = list(recipe_ids)
+    while stack:
+        for child, _ in children[stack.pop()]:
+            if child not in result:
+                result.add(child)
+                stack.append(child)
+    return result
+
+
+# 子が先になる順番に並べる（循環があれば RecipeCycleError） ----------------------------------------------------------------------
+def topological_order(recipe_ids, edges):
+    recipe_ids = set(recipe_ids)
+    pending = {recipe_id: 0 for recipe_id in recipe_ids}  # まだ計算していない子の数
+    parents = defaultdict(list)
+    for parent, child, _ in edges:
+        if parent in recipe_ids and child in recipe_ids:
+            pending[parent] += 1
+            parents[child].append(parent)
+
+    order = [recipe_id for recipe_id, count in pending.items() if count == 0]
+    for recipe_id in order:
+        for parent in parents[recipe_id]:
+            pending[parent] -= 1
+            if pending[parent] == 0:
+                order.append(parent)
+
+    if len(order) != len(recipe_ids):
+        raise RecipeCycleError("料理の部品関係が循環しています。")
+    return order
+
+
+# recipe_id の部品を component_ids にしたとき循環するか ----------------------------------------------------------------------
+def creates_cycle(recipe_id, component_ids, edges):
+    children = children_map((parent, child, amount) for parent, child, amount in edges if parent != recipe_id)
+    stack = list(component_ids)
+    seen = set()
+    while stack:
+        current = stack.pop()
+        if current == recipe_id:
+            return True
+        if current in seen:
+            continue
+        seen.add(current)
+        stack.extend(child for child, _ in children[current])
+    return False
+
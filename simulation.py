@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+# 価格の試算用の疎行列 ----------------------------------------------------------------------
+# 行が料理、列が食材、値が使用量（食材の単位、部品の料理は展開済み）。
+# 料理の合計コスト = 行列 × 食材の単価ベクトル
+
+
+class CostMatrix:
+    def __init__(self, recipes, rows):
+        # recipes: [(id, 名前, 食数)]、rows: {料理id: {食材id: 使用量}}
+        self.recipes = recipes
+        self.rows = [list(rows.get(id, {}).items()) for id, _, _ in recipes]
+        self.columns = defaultdict(list)  # 食材id -> [(行番号, 使用量)]
+        for i, row in enumerate(self.rows):
+            for ingredient_id, amount in row:
+                self.columns[ingredient_id].append((i, amount))
+
+    def totals(self, unit_prices):
+        return [sum(unit_prices.get(ingredient_id, 0) * amount for ingredient_id, amount in row) for row in self.rows]
+
+    def per_serving(self, totals):
+        return [total / servings if servings > 0 else 0 for total, (_, _, servings) in zip(totals, self.recipes)]
+
+    def simulate(self, unit_prices, scenarios):
+        # 基準の合計を一度だけ計算し、シナリオごとに変わった食材の列だけを足し込む
+        base = self.totals(unit_prices)
+        results = []
+        for overrides in scenarios:
+            totals = base.copy()
+            for ingredient_id, unit_price in overrides.items():
+                delta = unit_price - unit_prices.get(ingredient_id, 0)
+                for i, amount in self.columns.get(ingredient_id, ()):
+                    totals[i] += amount * delta
+            results.append(totals)
+        return base, results
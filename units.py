@@ -0,0 +1,51 @@
+# 単位の換算 ----------------------------------------------------------------------
+# 料理の使用量（大さじ・小さじ・カップなど）を食材の単位に換算する。
+
+# 単位 -> (種類, 基準単位での量)。体積は ml、重さは g が基準
+UNITS = {
+    'ml': ('volume', 1),
+    'cc': ('volume', 1),
+    'l': ('volume', 1000),
+    'L': ('volume', 1000),
+    '大さじ': ('volume', 15),
+    '小さじ': ('volume', 5),
+    'カップ': ('volume', 200),
+    'g': ('mass', 1),
+    'kg': ('mass', 1000),
+}
+
+# 密度が未登録の食材で体積⇔重さを換算するときの値（固体の大さじ1 = 9g）
+DEFAULT_DENSITY = 9 / 15  # g/ml
+
+# 同じ種類の単位どうしの換算表（起動時に一度だけ作る）
+CONVERSIONS = {
+    (from_unit, to_unit): from_amount / to_amount
+    for from_unit, (from_kind, from_amount) in UNITS.items()
+    for to_unit, (to_kind, to_amount) in UNITS.items()
+    if from_kind == to_kind
+}
+
+
+class UnitConversionError(ValueError):
+    pass
+
+
+# from_unit の1が to_unit でいくつになるかを返す関数 ----------------------------------------------------------------------
+def conversion_factor(from_unit, to_unit, density=None):
+    if not from_unit or from_unit == to_unit:
+        return 1.0
+    factor = CONVERSIONS.get((from_unit, to_unit))
+    if factor is not None:
+        return factor
+
+    # 体積⇔重さは密度（g/ml）で換算する
+    if from_unit in UNITS and to_unit in UNITS:
+        from_kind, from_amount = UNITS[from_unit]
+        to_kind, to_amount = UNITS[to_unit]
+        density = density or DEFAULT_DENSITY
+        if (from_kind, to_kind) == ('volume', 'mass'):
+            return from_amount * density / to_amount
+        if (from_kind, to_kind) == ('mass', 'volume'):
+            return from_amount / density / to_amount
+
+    raise UnitConversionError(f"{from_unit} を {to_unit} に換算できません。")